@@ -4,9 +4,12 @@ from flask import Flask
 from flask_cors import CORS, cross_origin
 import os
 from dotenv import load_dotenv
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
 from flask_apscheduler import APScheduler
 from flask_jwt_extended import JWTManager
 from flask_mongoengine import MongoEngine
+from pymongo.errors import OperationFailure
 
 # routes/blueprints
 from .routes.auth_routes import auth_bp
@@ -23,8 +26,15 @@ from .routes.users_routes import users_bp
 from .routes.achievements_routes import achievements_bp
 
 
+from .cli import register_commands
 from .utils.reset_user_streaks import reset_user_streaks
 from .utils.refill_rest_days import refill_rest_days
+from .utils.reconcile_workout_counters import reconcile_workout_counters
+from .utils.job_runner import run_job, MISFIRE_GRACE_SECONDS
+from .utils.notification_hub import hub, MongoPubSubBackend
+from .utils.index_audit import ensure_write_guard_indexes
+from .utils.user_summary_cache import set_user_summary_backend, BroadcastSummaryBackend, USER_SUMMARY_CACHE_SIZE, \
+    USER_SUMMARY_CACHE_TTL
 import cloudinary
 
 # Load environment variables
@@ -71,6 +81,22 @@ def create_app():
     jwt.init_app(app)
     db.init_app(app)
 
+    # Likes, follows and blocks are only deduplicated once their unique indexes exist, so these few
+    # are built at startup; a failure (e.g. existing duplicates) is left to `flask audit-indexes`
+    try:
+        ensure_write_guard_indexes()
+    except OperationFailure:
+        app.logger.exception('Creating the unique indexes of likes, follows and blocks failed, '
+                             'run `flask audit-indexes --dedupe`')
+
+    # Notification stream events reach the streams open in other processes through MongoDB
+    if os.getenv('NOTIFICATION_PUBSUB_BACKEND', 'mongo') == 'mongo':
+        hub.set_backend(MongoPubSubBackend())
+    # Renamed users and new profile photos are dropped from the user summary cache of every process
+    if os.getenv('USER_SUMMARY_CACHE_BACKEND', 'broadcast') == 'broadcast':
+        set_user_summary_backend(BroadcastSummaryBackend(
+            USER_SUMMARY_CACHE_SIZE, USER_SUMMARY_CACHE_TTL, MongoPubSubBackend('userSummaryInvalidations')))
+
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(exercises_bp, url_prefix='/exercises')
@@ -85,11 +111,38 @@ def create_app():
     app.register_blueprint(notifications_bp, url_prefix='/notifications')
     app.register_blueprint(reports_bp, url_prefix='/reports')
 
-    scheduler = APScheduler()
-    scheduler.init_app(app)
-    scheduler.start()
+    register_commands(app)
 
-    scheduler.add_job(id='Reset Streaks', func=reset_user_streaks, trigger='cron', hour=0, minute=1)
-    scheduler.add_job(id='Refill Rest Days', func=refill_rest_days, trigger='cron', day=1, hour=0, minute=1)
+    # Web processes leave the jobs to the dedicated worker (worker.py) unless told otherwise
+    if os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true':
+        start_scheduler(app)
 
     return app
+
+
+def start_scheduler(app, blocking=False):
+    """
+    Schedules the periodic jobs. Every run first takes a lease in MongoDB,
+    so a job executes once even when several processes run the scheduler.
+
+    Args:
+        app: The Flask application.
+        blocking: Run the scheduler in the calling thread instead of a background thread.
+    """
+    scheduler = APScheduler(scheduler=BlockingScheduler() if blocking else None)
+    scheduler.init_app(app)
+
+    refill_batch_size = os.getenv('REST_DAYS_REFILL_BATCH_SIZE')
+    jobs = [
+        ('Reset Streaks', reset_user_streaks, {}, {'hour': 0, 'minute': 1}),
+        ('Refill Rest Days', refill_rest_days, {'batch_size': int(refill_batch_size) if refill_batch_size else None},
+         {'day': 1, 'hour': 0, 'minute': 1}),
+        ('Reconcile Workout Counters', reconcile_workout_counters, {}, {'hour': 3, 'minute': 0}),
+    ]
+    for name, func, kwargs, schedule in jobs:
+        trigger = CronTrigger(timezone=scheduler.scheduler.timezone, **schedule)
+        scheduler.add_job(id=name, func=run_job, args=(name, func), kwargs={'kwargs': kwargs, 'trigger': trigger},
+                          trigger=trigger, misfire_grace_time=MISFIRE_GRACE_SECONDS)
+
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,66 @@
+import click
+
+from fitness_app.models import JobRun
+from fitness_app.utils.index_audit import ensure_all_indexes, explain_canonical_queries, remove_duplicate_relations
+from fitness_app.utils.reconcile_workout_counters import reconcile_workout_counters
+from fitness_app.utils.reset_user_streaks import backfill_streak_expiry
+from fitness_app.utils.timeline import rebuild_timelines
+from fitness_app.utils.user_search import backfill_user_search_keys
+from fitness_app.utils.user_stats import rebuild_user_stats
+
+
+def register_commands(app):
+    @app.cli.command('audit-indexes')
+    @click.option('--dedupe', is_flag=True, help='Delete duplicate likes/follows/blocks blocking unique indexes.')
+    def audit_indexes(dedupe):
+        """Ensure declared indexes exist and fail if any route's canonical query does a COLLSCAN."""
+        if dedupe:
+            for collection, count in remove_duplicate_relations().items():
+                click.echo(f'Removed {count} duplicate documents from {collection}')
+
+        ensure_all_indexes()
+
+        failed = []
+        for description, stages, uses_collscan in explain_canonical_queries():
+            click.echo(f"{'COLLSCAN' if uses_collscan else 'OK':<9}{description}: {' > '.join(stages)}")
+            if uses_collscan:
+                failed.append(description)
+
+        if failed:
+            raise click.ClickException(f'{len(failed)} queries do a collection scan: {", ".join(failed)}')
+
+    @app.cli.command('backfill-user-search')
+    def backfill_user_search():
+        """Compute the normalized username search keys of users saved before they existed."""
+        click.echo(f'Updated {backfill_user_search_keys()} users')
+
+    @app.cli.command('backfill-streak-expiry')
+    def backfill_streak_expiry_command():
+        """Set the streak expiry date of users with a streak saved before it existed."""
+        click.echo(f'Updated {backfill_streak_expiry()} users')
+
+    @app.cli.command('backfill-user-stats')
+    def backfill_user_stats():
+        """Rebuild every user's workout stats document from their workouts."""
+        click.echo(f'Wrote {rebuild_user_stats()} stats documents')
+
+    @app.cli.command('backfill-timelines')
+    def backfill_timelines():
+        """Rebuild every user's followed-feed timeline from their follows."""
+        click.echo(f'Rebuilt {rebuild_timelines()} timelines')
+
+    @app.cli.command('reconcile-workout-counters')
+    def reconcile_workout_counters_command():
+        """Recount the likes and comments of every workout, filling counters missing on older workouts."""
+        result = reconcile_workout_counters()
+        click.echo(f"Updated {result['modified']} of {result['scanned']} workouts")
+
+    @app.cli.command('job-runs')
+    @click.option('--limit', default=20, help='Number of most recent runs to show.')
+    @click.option('--job', default=None, help='Only show runs of this job.')
+    def job_runs(limit, job):
+        """Show the history of scheduled job runs."""
+        runs = JobRun.objects(job=job) if job else JobRun.objects
+        for run in runs.order_by('-startedAt').limit(limit):
+            click.echo(f'{run.startedAt:%Y-%m-%d %H:%M:%S}  {run.job:<28}{run.status:<11}'
+                       f'{run.durationMs or 0:>8}ms  rows={run.rowsTouched}  {run.owner}  {run.error or ""}')
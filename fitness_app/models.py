@@ -1,7 +1,12 @@
 from mongoengine import Document, StringField, EmailField, IntField, DateTimeField, DateField, EmbeddedDocument, \
-    EmbeddedDocumentField, ListField, ReferenceField, BooleanField
+    EmbeddedDocumentField, ListField, ReferenceField, BooleanField, DictField, \
+    ObjectIdField
 from datetime import datetime, timezone
 
+from fitness_app.utils.search_text import normalize, trigrams
+
+# Every model sets auto_create_index to False: indexes are built by `flask audit-indexes`,
+# not by the first request touching a collection in each process
 
 # User model
 class User(Document):
@@ -13,10 +18,30 @@ class User(Document):
     registrationDate = DateTimeField(default=lambda: datetime.now(timezone.utc))
     profilePhotoUrl = StringField(default=None)
     lastStreakEvidence = DateField()
+    streakExpiresOn = DateField()
     streak = IntField(default=0)
     restDays = IntField(default=10)
-
-    meta = {'collection': 'users'}
+    restDaysRefilledOn = DateField()
+    fanoutOnRead = BooleanField(default=False)
+    searchKey = StringField()
+    searchGrams = ListField(StringField())
+    unreadNotifications = IntField(default=0)
+
+    meta = {
+        'collection': 'users',
+        'auto_create_index': False,
+        'indexes': [
+            ('searchKey', 'id'),
+            'searchGrams',
+            {'fields': ['fanoutOnRead'], 'partialFilterExpression': {'fanoutOnRead': True}},
+            {'fields': ['streakExpiresOn'], 'sparse': True},
+        ],
+    }
+
+    def clean(self):
+        # Normalized username used by the indexed prefix and infix search
+        self.searchKey = normalize(self.username)
+        self.searchGrams = trigrams(self.searchKey)
 
 
 class AchievementCondition(EmbeddedDocument):
@@ -30,15 +55,24 @@ class Achievement(Document):
     description = StringField(required=True)
     conditions = ListField(EmbeddedDocumentField(AchievementCondition), required=True)
 
-    meta = {'collection': 'achievements'}
+    meta = {'collection': 'achievements', 'auto_create_index': False}
 
 
 class AchievementGained(Document):
     user = ReferenceField(User, required=True)
     achievement = ReferenceField(Achievement, required=True)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
+    # Set once the gain has been returned by /achievements/check
+    reported = BooleanField(default=False)
 
-    meta = {'collection': 'achievementsGained'}
+    meta = {
+        'collection': 'achievementsGained',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['user', 'achievement'], 'unique': True},
+            ('user', 'reported'),
+        ],
+    }
 
 
 class Follow(Document):
@@ -46,7 +80,14 @@ class Follow(Document):
     follower = ReferenceField(User, required=True, dbref_id_field='id_following')
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'follows'}
+    meta = {
+        'collection': 'follows',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['follower', 'followed'], 'unique': True},
+            'followed',
+        ],
+    }
 
 
 class BodyPart(Document):
@@ -54,14 +95,14 @@ class BodyPart(Document):
     pplPlan = StringField(required=True)
     ulPlan = StringField(required=True)
 
-    meta = {'collection': 'bodyParts'}
+    meta = {'collection': 'bodyParts', 'auto_create_index': False}
 
 
 class Equipment(Document):
     name = StringField(required=True)
     type = StringField(required=True)
 
-    meta = {'collection': 'equipment'}
+    meta = {'collection': 'equipment', 'auto_create_index': False}
 
 
 class ExerciseSet(EmbeddedDocument):
@@ -78,7 +119,14 @@ class Exercise(Document):
     secondaryMuscles = ListField(StringField())
     instructions = ListField(StringField())
 
-    meta = {'collection': 'exercises'}
+    meta = {
+        'collection': 'exercises',
+        'auto_create_index': False,
+        'indexes': [
+            ('bodyPart', 'id'),
+            ('equipment', 'id'),
+        ],
+    }
 
 
 class WorkoutExercise(EmbeddedDocument):
@@ -91,7 +139,11 @@ class Routine(Document):
     name = StringField(max_length=100, required=True)
     exercises = ListField(EmbeddedDocumentField(WorkoutExercise), required=True)
 
-    meta = {'collection': 'routines'}
+    meta = {
+        'collection': 'routines',
+        'auto_create_index': False,
+        'indexes': ['user'],
+    }
 
 
 class Workout(Document):
@@ -103,8 +155,44 @@ class Workout(Document):
     imageUrl = StringField(default=None)
     postContent = StringField(max_length=100)
     exercises = ListField(EmbeddedDocumentField(WorkoutExercise), required=True)
+    likesCount = IntField(default=0)
+    commentsCount = IntField(default=0)
+
+    meta = {
+        'collection': 'workouts',
+        'auto_create_index': False,
+        'indexes': [
+            ('user', '-timestamp', '-id'),
+            ('-timestamp', '-id'),
+        ],
+    }
+
+
+class UserStats(Document):
+    user = ReferenceField(User, required=True, unique=True)
+    workoutsCount = IntField(default=0)
+    totalDuration = IntField(default=0)
+    longestStreak = IntField(default=0)
+    lastWorkoutAt = DateTimeField()
+
+    meta = {'collection': 'userStats', 'auto_create_index': False}
+
+
+class TimelineEntry(EmbeddedDocument):
+    workout = ReferenceField(Workout, required=True)
+    author = ReferenceField(User, required=True)
+    timestamp = DateTimeField(required=True)
+
+
+class Timeline(Document):
+    user = ReferenceField(User, required=True, unique=True)
+    entries = ListField(EmbeddedDocumentField(TimelineEntry))
 
-    meta = {'collection': 'workouts'}
+    meta = {
+        'collection': 'timelines',
+        'auto_create_index': False,
+        'indexes': ['entries.workout', 'entries.author'],
+    }
 
 
 class WorkoutLike(Document):
@@ -112,7 +200,14 @@ class WorkoutLike(Document):
     workout = ReferenceField(Workout, required=True)  # Assuming a Post model exists
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'workoutLikes'}
+    meta = {
+        'collection': 'workoutLikes',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['workout', 'user'], 'unique': True},
+            ('user', 'workout'),
+        ],
+    }
 
 
 class WorkoutComment(Document):
@@ -121,7 +216,14 @@ class WorkoutComment(Document):
     body = StringField(required=True)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'workoutComments'}
+    meta = {
+        'collection': 'workoutComments',
+        'auto_create_index': False,
+        'indexes': [
+            ('workout', 'timestamp'),
+            ('user', 'workout'),
+        ],
+    }
 
 
 class Notification(Document):
@@ -129,8 +231,29 @@ class Notification(Document):
     initiator = ReferenceField(User, required=True)
     action = StringField(required=True)
     targetWorkout = ReferenceField(Workout, required=False)
+    targetAchievement = ReferenceField(Achievement, required=False)
+    read = BooleanField(default=False)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
-    meta = {'collection': 'notifications'}
+    # Coalesced like/comment notifications: start of the time bucket, number of events
+    # and the most recent distinct initiators, newest first
+    bucket = DateTimeField()
+    count = IntField()
+    initiators = ListField(ReferenceField(User))
+    # Set by the coalescing write that turned the notification unread, which tells that write to count it
+    markedUnreadBy = ObjectIdField()
+
+    meta = {
+        'collection': 'notifications',
+        'auto_create_index': False,
+        'indexes': [
+            ('user', '-timestamp', '-id'),
+            ('user', 'read'),
+            'targetWorkout',
+            'initiator',
+            {'fields': ['user', 'action', 'targetWorkout', 'bucket'], 'unique': True,
+             'partialFilterExpression': {'bucket': {'$exists': True}}},
+        ],
+    }
 
 
 class UserReport(Document):
@@ -140,7 +263,14 @@ class UserReport(Document):
     isResolved = BooleanField(default=False)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'userReports'}
+    meta = {
+        'collection': 'userReports',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['reporter', 'reported'], 'unique': True},
+            'reported',
+        ],
+    }
 
 
 class WorkoutReport(Document):
@@ -150,7 +280,13 @@ class WorkoutReport(Document):
     isResolved = BooleanField(default=False)
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'workoutReports'}
+    meta = {
+        'collection': 'workoutReports',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['reporter', 'workout'], 'unique': True},
+        ],
+    }
 
 
 class Block(Document):
@@ -158,4 +294,39 @@ class Block(Document):
     blocked = ReferenceField(User, required=True, dbref_id_field='id_blocked')
     timestamp = DateTimeField(default=lambda: datetime.now(timezone.utc))
 
-    meta = {'collection': 'userBlocks'}
+    meta = {
+        'collection': 'userBlocks',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['blocking', 'blocked'], 'unique': True},
+            'blocked',
+        ],
+    }
+
+
+class JobLock(Document):
+    name = StringField(primary_key=True)
+    owner = StringField()
+    lastRunKey = StringField()
+    expiresAt = DateTimeField()
+
+    meta = {'collection': 'jobLocks', 'auto_create_index': False}
+
+
+class JobRun(Document):
+    job = StringField(required=True)
+    runKey = StringField(required=True)
+    owner = StringField(required=True)
+    status = StringField(required=True, choices=('running', 'succeeded', 'failed'))
+    startedAt = DateTimeField(required=True)
+    finishedAt = DateTimeField()
+    durationMs = IntField()
+    rowsTouched = IntField()
+    result = DictField()
+    error = StringField()
+
+    meta = {
+        'collection': 'jobRuns',
+        'auto_create_index': False,
+        'indexes': [('job', '-startedAt')],
+    }
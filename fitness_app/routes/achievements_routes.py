@@ -3,7 +3,10 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from mongoengine import DoesNotExist
 from bson import ObjectId
 
-from fitness_app.models import User, Achievement, AchievementGained, Workout
+from fitness_app.models import User, Achievement, AchievementGained
+from fitness_app.utils.achievement_catalog import get_achievement_catalog
+from fitness_app.utils.batch_loader import load_references
+from fitness_app.utils.http_cache import versioned_response
 
 achievements_bp = Blueprint('achievements', __name__)
 
@@ -13,35 +16,19 @@ achievements_bp = Blueprint('achievements', __name__)
 def check_achievements():
     current_user_id = get_jwt_identity()
     try:
-        user = User.objects.get(id=ObjectId(current_user_id))
+        user = User.objects.only('id').get(id=ObjectId(current_user_id))
 
-        # Calculate workouts and workoutMinutes for the user
-        workouts = Workout.objects(user=user).count()
-        workoutMinutes = sum(workout.duration for workout in Workout.objects(user=user))/60
+        # Achievements are evaluated in the background when a workout is saved,
+        # so this only returns the gains the client has not been shown yet
+        gains = list(AchievementGained.objects(user=user.id, reported=False).only('id', 'achievement').as_pymongo())
+        if gains:
+            AchievementGained.objects(id__in=[gain['_id'] for gain in gains]).update(set__reported=True)
 
-        all_achievements = Achievement.objects  # Fetch all achievements
-        achievements_gained = AchievementGained.objects(user=user).only('achievement')
-        gained_achievement_ids = {gained.achievement.id for gained in achievements_gained}
-
-        newly_gained_achievements = []
-
-        for achievement in all_achievements:
-            if achievement.id in gained_achievement_ids:
-                continue  # Skip if already gained
-
-            conditions_met = all([
-                (user.streak >= condition.streakNumber or condition.streakNumber == 0) and
-                (workouts >= condition.workoutsNumber or condition.workoutsNumber == 0) and
-                (workoutMinutes >= condition.minutes or condition.minutes == 0)
-                for condition in achievement.conditions
-            ])
-
-            if conditions_met:
-                AchievementGained(user=user, achievement=achievement).save()
-                newly_gained_achievements.append({
-                    "name": achievement.name,
-                    "description": achievement.description
-                })
+        catalog = get_achievement_catalog()
+        newly_gained_achievements = [{
+            "name": catalog.achievements[gain['achievement']]['name'],
+            "description": catalog.achievements[gain['achievement']]['description']
+        } for gain in gains if gain['achievement'] in catalog.achievements]
 
         # Check if any achievements were gained
         if newly_gained_achievements:
@@ -57,13 +44,14 @@ def check_achievements():
 @jwt_required()
 def user_achievements(user_id):
     try:
-        achievements_gained = AchievementGained.objects(user=ObjectId(user_id))
+        achievements_gained = list(AchievementGained.objects(user=ObjectId(user_id)).as_pymongo())
+        achievements_by_id = load_references(achievements_gained, 'achievement', Achievement, ('name', 'description'))
 
         achievements = [{
-            "name": gain.achievement.name,
-            "description": gain.achievement.description,
-            "timestamp": gain.timestamp
-        } for gain in achievements_gained]
+            "name": achievements_by_id[gain['achievement']]['name'],
+            "description": achievements_by_id[gain['achievement']]['description'],
+            "timestamp": gain['timestamp']
+        } for gain in achievements_gained if gain['achievement'] in achievements_by_id]
 
         return jsonify(achievements), 200
 
@@ -73,11 +61,13 @@ def user_achievements(user_id):
 
 @achievements_bp.route('/all', methods=['GET'])
 def list_achievements():
-    achievements = Achievement.objects
-    achievements_list = [{
-        "name": achievement.name,
-        "description": achievement.description,
-        "conditions": achievement.conditions  # You might want to format this more nicely
-    } for achievement in achievements]
-
-    return jsonify(achievements_list), 200
+    catalog = get_achievement_catalog()
+
+    def build():
+        return jsonify([{
+            "name": achievement['name'],
+            "description": achievement['description'],
+            "conditions": achievement['conditions']  # You might want to format this more nicely
+        } for achievement in catalog.achievements.values()])
+
+    return versioned_response(catalog.version, build)
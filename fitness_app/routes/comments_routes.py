@@ -1,11 +1,14 @@
 from datetime import datetime
 
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from mongoengine.errors import ValidationError
-from fitness_app.models import WorkoutComment, User, Notification, Workout
+from fitness_app.models import WorkoutComment, User, Workout
+from fitness_app.utils.notifications import coalesce_notification, uncoalesce_notification, remove_notifications
 from fitness_app.utils.serializer import serialize_doc
+from fitness_app.utils.user_summary_cache import get_user_summaries
 
 comments_bp = Blueprint('comments', __name__)
 
@@ -25,14 +28,10 @@ def add_comment(workout_id):
 
         new_comment = WorkoutComment(user=initiator, workout=workout, body=body)
         new_comment.save()
+        Workout.objects(id=workout.id).update_one(inc__commentsCount=1)
 
         if str(workout.user.id) != user_id:
-            Notification(
-                user=workout.user,
-                initiator=initiator,
-                action='comment',
-                targetWorkout=workout,
-            ).save()
+            coalesce_notification(workout.user.id, initiator.id, 'comment', workout.id, new_comment.timestamp)
 
         comment_data = serialize_doc(new_comment.to_mongo().to_dict())
         comment_data['user'] = {
@@ -50,23 +49,20 @@ def add_comment(workout_id):
 @jwt_required()
 def fetch_comments(workout_id):
     try:
-        comments = WorkoutComment.objects(workout=workout_id)
+        comments = list(WorkoutComment.objects(workout=workout_id).as_pymongo())
+        # Fetch the users of all comments at once
+        users = get_user_summaries(comment['user'] for comment in comments)
 
         comments_data = []
 
         for comment in comments:
-            # Serialize the comment document
-            comment_data = serialize_doc(comment.to_mongo().to_dict())
+            user = users.get(comment['user'])
+            if user is None:
+                continue
 
-            # Fetch the user for each comment
-            user = comment.user
-
-            # Embed user details directly into the comment data
-            comment_data['user'] = {
-                "_id": str(user.id),
-                "username": user.username,
-                "profilePhotoUrl": user.profilePhotoUrl
-            }
+            # Serialize the comment document and embed user details directly into it
+            comment_data = serialize_doc(comment)
+            comment_data['user'] = user
 
             comments_data.append(comment_data)
 
@@ -80,18 +76,27 @@ def fetch_comments(workout_id):
 @jwt_required()
 def delete_comment(comment_id):
     try:
-        comment = WorkoutComment.objects.get(id=comment_id)
-
-        # Delete the associated notification, using both the workout and the commenter
-        Notification.objects(
-            action='comment',
-            targetWorkout=comment.workout,
-            initiator=comment.user
-        ).delete()
-
-        comment.delete()
-        return jsonify({"message": "Comment deleted successfully."}), 200
-    except WorkoutComment.DoesNotExist:
-        return jsonify({"error": "Comment not found."}), 404
-    except ValidationError:
+        comment_id = ObjectId(comment_id)
+    except InvalidId:
         return jsonify({"error": "Invalid comment ID."}), 400
+
+    # Only one of concurrent deletes removes the comment, so the counter drops once
+    comment = WorkoutComment._get_collection().find_one_and_delete(
+        {'_id': comment_id}, projection={'user': 1, 'workout': 1, 'timestamp': 1})
+    if not comment:
+        return jsonify({"error": "Comment not found."}), 404
+
+    workout = Workout._get_collection().find_one_and_update(
+        {'_id': comment['workout']}, {'$inc': {'commentsCount': -1}}, projection={'user': 1})
+
+    # Take the comment out of the coalesced notification and delete legacy per-comment ones
+    if workout and workout['user'] != comment['user']:
+        uncoalesce_notification(workout['user'], comment['user'], 'comment', comment['workout'], comment['timestamp'])
+    remove_notifications(
+        action='comment',
+        targetWorkout=comment['workout'],
+        initiator=comment['user'],
+        bucket=None
+    )
+
+    return jsonify({"message": "Comment deleted successfully."}), 200
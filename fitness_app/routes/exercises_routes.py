@@ -1,41 +1,64 @@
-import os
+import json
 
 from bson import ObjectId
-from flask import jsonify, Blueprint, request
-from fitness_app.models import BodyPart, Equipment, Exercise  # Adjust import path as needed
-from fitness_app.utils.serializer import serialize_doc
+from bson.errors import InvalidId
+from flask import jsonify, Blueprint, request, Response
+from fitness_app.utils.cursor import decode_cursor, encode_cursor
+from fitness_app.utils.exercise_catalog import get_exercise_catalog
+from fitness_app.utils.http_cache import versioned_response
 
 exercises_bp = Blueprint('exercises', __name__)
 
+MAX_SEARCH_LIMIT = 50
+MAX_SUGGESTIONS = 20
+
+# All endpoints are served from the in-memory catalog snapshot without querying the database,
+# and its version is the ETag of every successful response
+
+
+def _json_response(body, status=200):
+    """Wraps an already serialized JSON body."""
+    return Response(body, status=status, mimetype='application/json')
+
+
+def _validate_filters(*ids):
+    try:
+        for value in ids:
+            if value:
+                ObjectId(value)
+        return True
+    except InvalidId:
+        return False
+
 
 @exercises_bp.route("/bodyParts", methods=["GET"])
 def get_body_parts_list():
-    body_parts = BodyPart.objects.all()
-    serialized_body_parts = [serialize_doc(body_part.to_mongo().to_dict()) for body_part in body_parts]
-    return jsonify(serialized_body_parts)
+    catalog = get_exercise_catalog()
+    return versioned_response(catalog.version, lambda: _json_response(catalog.body_parts_json))
 
 
 @exercises_bp.route("/bodyParts/<_id>", methods=["GET"])
 def get_body_part(_id):
-    body_part = BodyPart.objects.with_id(_id)
+    catalog = get_exercise_catalog()
+    body_part = catalog.body_part_by_id.get(_id)
     if not body_part:
         return jsonify({"error": "Body part not found"}), 404
-    return body_part.to_json()
+    return versioned_response(catalog.version, lambda: body_part)
 
 
 @exercises_bp.route("/equipment", methods=["GET"])
 def get_equipment_list():
-    equipment = Equipment.objects.all()
-    serialized_equipment = [serialize_doc(eq.to_mongo().to_dict()) for eq in equipment]
-    return jsonify(serialized_equipment)
+    catalog = get_exercise_catalog()
+    return versioned_response(catalog.version, lambda: _json_response(catalog.equipment_json))
 
 
 @exercises_bp.route("/equipment/<_id>", methods=["GET"])
 def get_equipment(_id):
-    eq = Equipment.objects.with_id(_id)
+    catalog = get_exercise_catalog()
+    eq = catalog.equipment_by_id.get(_id)
     if not eq:
         return jsonify({"error": "Equipment not found"}), 404
-    return eq.to_json()
+    return versioned_response(catalog.version, lambda: eq)
 
 
 @exercises_bp.route("/exercise", methods=["GET"])
@@ -51,33 +74,69 @@ def get_exercises():
     name_query = request.args.get('query', '')
     skip = (page - 1) * limit
 
-    query = {}
-    if body_part:
-        query['bodyPart'] = ObjectId(body_part)
-    if equipment:
-        query['equipment'] = ObjectId(equipment)
-    if name_query:
-        query['name'] = {'$regex': name_query, '$options': 'i'}
+    after_id = None
+    after = request.args.get('after')
+    if after:
+        try:
+            after_id, = decode_cursor(after, ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-    try:
-        exercises_query = Exercise.objects(__raw__=query).skip(skip).limit(limit)
-        exercises = list(exercises_query)
-        serialized_exercises = [serialize_doc(exercise.to_mongo().to_dict()) for exercise in exercises]
-        total_exercises = Exercise.objects(__raw__=query).count()
-        has_more = skip + limit < total_exercises
+    if not _validate_filters(body_part, equipment):
+        return jsonify({"error": "Invalid bodyPart or equipment id"}), 400
+
+    catalog = get_exercise_catalog()
 
-        return jsonify({
-            'exercises': serialized_exercises,
-            'hasMore': has_more
-        }), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    def build():
+        rows, has_more, last_id = catalog.page(body_part, equipment, name_query, skip, limit, after_id)
+        next_cursor = encode_cursor(last_id) if last_id else None
+        # The rows are pre-serialized, so the response is assembled around them instead of re-encoding
+        return _json_response('{"exercises":[%s],"hasMore":%s,"nextCursor":%s}' % (
+            ','.join(rows), json.dumps(has_more), json.dumps(next_cursor)))
+
+    return versioned_response(catalog.version, build)
+
+
+@exercises_bp.route("/search", methods=["GET"])
+def search_exercises():
+    """
+    Ranked search of exercise names, targets and secondary muscles that tolerates typos and partial words.
+    Accepts the q, bodyPart, equipment, page and limit query parameters.
+    """
+    page_str = request.args.get('page', '1')
+    limit_str = request.args.get('limit', '20')
+    page = max(int(page_str), 1) if page_str.isdigit() else 1
+    limit = min(int(limit_str), MAX_SEARCH_LIMIT) if limit_str.isdigit() else 20
+
+    body_part = request.args.get('bodyPart', '')
+    equipment = request.args.get('equipment', '')
+    if not _validate_filters(body_part, equipment):
+        return jsonify({"error": "Invalid bodyPart or equipment id"}), 400
+
+    catalog = get_exercise_catalog()
+
+    def build():
+        rows, has_more = catalog.search(request.args.get('q', ''), body_part, equipment, (page - 1) * limit, limit)
+        return _json_response('{"exercises":[%s],"hasMore":%s}' % (','.join(rows), json.dumps(has_more)))
+
+    return versioned_response(catalog.version, build)
+
+
+@exercises_bp.route("/autocomplete", methods=["GET"])
+def autocomplete_exercises():
+    """Suggests exercises for the query being typed in q, the last word being matched as a prefix."""
+    limit_str = request.args.get('limit', '10')
+    limit = min(int(limit_str), MAX_SUGGESTIONS) if limit_str.isdigit() else 10
+    catalog = get_exercise_catalog()
+    return versioned_response(catalog.version, lambda: jsonify({
+        "suggestions": catalog.suggest(request.args.get('q', ''), limit)
+    }))
 
 
 @exercises_bp.route("/<exercise_id>", methods=["GET"])
 def get_exercise(exercise_id):
-    exercise = Exercise.objects.with_id(exercise_id)
-    serialized_exercise = serialize_doc(exercise.to_mongo().to_dict())
+    catalog = get_exercise_catalog()
+    exercise = catalog.exercise_json(exercise_id)
     if not exercise:
-        return jsonify({"error": "Equipment not found"}), 404
-    return jsonify(serialized_exercise)
+        return jsonify({"error": "Exercise not found"}), 404
+    return versioned_response(catalog.version, lambda: _json_response(exercise))
@@ -1,10 +1,14 @@
 from datetime import datetime
 
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from fitness_app.models import Follow, User, Notification  # Adjust the import path as necessary
+from fitness_app.models import Follow, User  # Adjust the import path as necessary
 from mongoengine.errors import NotUniqueError
+from fitness_app.utils.notifications import create_notification, remove_notifications
+from fitness_app.utils.timeline import backfill_timeline, remove_author_from_timeline
+from fitness_app.utils.user_summary_cache import get_user_summaries
 
 follows_bp = Blueprint('follows', __name__)
 
@@ -16,13 +20,22 @@ def follow_user(user_id):
     if current_user_id == user_id:
         return jsonify({"message": "You cannot follow yourself."}), 400
 
-    follower = User.objects.get(id=current_user_id)
-    followed = User.objects.get(id=user_id)
-    if Follow.objects(followed=followed, follower=follower).first():
+    try:
+        follower_id = ObjectId(current_user_id)
+        followed_id = ObjectId(user_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user ID."}), 400
+    if not User.objects(id=followed_id).count(with_limit_and_skip=True):
+        return jsonify({"error": "User not found."}), 404
+
+    # The unique (follower, followed) index rejects a second follow, also from concurrent retries
+    try:
+        Follow(followed=followed_id, follower=follower_id).save(force_insert=True)
+    except NotUniqueError:
         return jsonify({"message": "Already following this user."}), 400
 
-    Follow(followed=followed, follower=follower).save()
-    Notification(user=followed, initiator=follower, action='follow').save()
+    create_notification(followed_id, follower_id, 'follow')
+    backfill_timeline(follower_id, followed_id)
 
     return jsonify({"message": "Successfully followed the user."}), 200
 
@@ -30,16 +43,19 @@ def follow_user(user_id):
 @follows_bp.route('/unfollow/<user_id>', methods=['POST'])
 @jwt_required()
 def unfollow_user(user_id):
-    current_user_id = get_jwt_identity()
-    follower = User.objects.get(id=current_user_id)
-    followed = User.objects.get(id=user_id)
-    follow_relationship = Follow.objects(followed=followed, follower=follower).first()
-
+    try:
+        follower_id = ObjectId(get_jwt_identity())
+        followed_id = ObjectId(user_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user ID."}), 400
+
+    follow_relationship = Follow._get_collection().find_one_and_delete(
+        {'follower': follower_id, 'followed': followed_id}, projection={'_id': 1})
     if not follow_relationship:
         return jsonify({"message": "Not following this user."}), 400
 
-    follow_relationship.delete()
-    Notification.objects(user=followed, initiator=follower, action='follow').delete()
+    remove_notifications(user=followed_id, initiator=follower_id, action='follow')
+    remove_author_from_timeline(follower_id, followed_id)
 
     return jsonify({"message": "Successfully unfollowed the user."}), 200
 
@@ -49,14 +65,15 @@ def unfollow_user(user_id):
 def fetch_follows_by_user_id(user_id):
 
     # Fetching followers: those who follow the current user
-    followers_relations = Follow.objects(followed=ObjectId(user_id))
-    followers = User.objects(id__in=[relation.follower.id for relation in followers_relations])
-    followers_data = [{'_id': str(user.id), 'username': user.username, 'profilePhotoUrl': user.profilePhotoUrl} for user in followers]
+    follower_ids = [relation['follower'] for relation in Follow.objects(followed=ObjectId(user_id)).only('follower').as_pymongo()]
 
     # Fetching following: those the current user is following
-    following_relations = Follow.objects(follower=ObjectId(user_id))
-    following = User.objects(id__in=[relation.followed.id for relation in following_relations])
-    following_data = [{'_id': str(user.id), 'username': user.username, 'profilePhotoUrl': user.profilePhotoUrl} for user in following]
+    following_ids = [relation['followed'] for relation in Follow.objects(follower=ObjectId(user_id)).only('followed').as_pymongo()]
+
+    # Both lists are hydrated from the summary cache with at most one query
+    users = get_user_summaries(follower_ids + following_ids)
+    followers_data = [users[follower_id] for follower_id in follower_ids if follower_id in users]
+    following_data = [users[followed_id] for followed_id in following_ids if followed_id in users]
 
     return jsonify({
         'followers': followers_data,
@@ -8,6 +8,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from fitness_app.models import Exercise, User
 from fitness_app.utils.upload_user_profile_image import upload_user_profile_image
+from fitness_app.utils.user_summary_cache import invalidate_user_summaries
 from fitness_app.utils.validate_and_get_file import validate_and_get_file
 
 images_bp = Blueprint('images', __name__)
@@ -25,6 +26,7 @@ def upload_image():
     try:
         user.profilePhotoUrl = upload_user_profile_image(file, user_id)
         user.save()
+        invalidate_user_summaries(user.id)
         return jsonify({'url': user.profilePhotoUrl}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
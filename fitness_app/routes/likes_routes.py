@@ -1,10 +1,11 @@
-from datetime import datetime
-
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from mongoengine.errors import ValidationError, DoesNotExist
-from fitness_app.models import WorkoutLike, User, Workout, Notification
+from mongoengine.errors import ValidationError, DoesNotExist, NotUniqueError
+from fitness_app.models import WorkoutLike, Workout
+from fitness_app.utils.notifications import coalesce_notification, uncoalesce_notification, remove_notifications
+from fitness_app.utils.user_summary_cache import get_user_summaries
 
 likes_bp = Blueprint('likes', __name__)
 
@@ -12,69 +13,70 @@ likes_bp = Blueprint('likes', __name__)
 @likes_bp.route('/like/<workout_id>', methods=['POST'])
 @jwt_required()
 def like_workout(workout_id):
-    user_id = get_jwt_identity()
     try:
-        initiator = User.objects.get(id=user_id)  # The one who likes the workout
-        workout = Workout.objects.get(id=workout_id)
-
-        if WorkoutLike.objects(user=initiator, workout=workout).first():
-            return jsonify({"message": "Workout already liked."}), 400
-
-        new_like = WorkoutLike(user=initiator, workout=workout)
-        new_like.save()
-
-        # Check if the workout being liked is not the user's own workout
-        if str(workout.user.id) != str(user_id):
-            # Create a notification for the workout owner with the initiator
-            Notification(
-                user=workout.user,  # The owner of the workout
-                initiator=initiator,  # The one who performed the like action
-                action='like',
-                targetWorkout=workout,
-                timestamp=datetime.utcnow()
-            ).save()
-
-        return jsonify({"message": "Workout liked successfully."}), 200
-    except (ValidationError, DoesNotExist):
+        user_id = ObjectId(get_jwt_identity())  # The one who likes the workout
+        workout_id = ObjectId(workout_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user or workout ID."}), 400
+
+    # The unique (workout, user) index rejects a second like, also from concurrent retries
+    try:
+        new_like = WorkoutLike(user=user_id, workout=workout_id).save(force_insert=True)
+    except NotUniqueError:
+        return jsonify({"message": "Workout already liked."}), 400
+
+    workout = Workout._get_collection().find_one_and_update(
+        {'_id': workout_id}, {'$inc': {'likesCount': 1}}, projection={'user': 1})
+    if not workout:
+        new_like.delete()
         return jsonify({"error": "Invalid user or workout ID."}), 400
 
+    # Check if the workout being liked is not the user's own workout
+    if workout['user'] != user_id:
+        # Count the like in the owner's coalesced notification for this workout
+        coalesce_notification(workout['user'], user_id, 'like', workout_id, new_like.timestamp)
+
+    return jsonify({"message": "Workout liked successfully."}), 200
+
 
 @likes_bp.route('/unlike/<workout_id>', methods=['POST'])
 @jwt_required()
 def unlike_workout(workout_id):
-    user_id = get_jwt_identity()
     try:
-        initiator = User.objects.get(id=user_id)  # The one who unlikes the workout
-        workout = Workout.objects.get(id=workout_id)
+        user_id = ObjectId(get_jwt_identity())  # The one who unlikes the workout
+        workout_id = ObjectId(workout_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user or workout ID."}), 400
 
-        like = WorkoutLike.objects(user=initiator, workout=workout).first()
-        if not like:
-            return jsonify({"message": "Workout not previously liked."}), 400
+    # Only one of concurrent unlikes deletes the like, so the counter drops once
+    like = WorkoutLike._get_collection().find_one_and_delete(
+        {'workout': workout_id, 'user': user_id}, projection={'timestamp': 1})
+    if not like:
+        return jsonify({"message": "Workout not previously liked."}), 400
 
-        # Delete the like
-        like.delete()
+    workout = Workout._get_collection().find_one_and_update(
+        {'_id': workout_id}, {'$inc': {'likesCount': -1}}, projection={'user': 1})
 
-        # Find and delete the corresponding notification using the initiator
-        notification = Notification.objects(initiator=initiator, action='like', targetWorkout=workout).first()
-        if notification:
-            notification.delete()
+    # Take the like out of the coalesced notification and delete a legacy per-like one
+    if workout and workout['user'] != user_id:
+        uncoalesce_notification(workout['user'], user_id, 'like', workout_id, like['timestamp'])
+    remove_notifications(initiator=user_id, action='like', targetWorkout=workout_id, bucket=None)
 
-        return jsonify({"message": "Workout unlike successful."}), 200
-    except (ValidationError, DoesNotExist):
-        return jsonify({"error": "Invalid user or workout ID."}), 400
+    return jsonify({"message": "Workout unlike successful."}), 200
 
 
 @likes_bp.route('/<workout_id>', methods=['GET'])
 @jwt_required()
 def fetch_workout_likes(workout_id):
     try:
-        workout_likes = WorkoutLike.objects(workout=ObjectId(workout_id))
+        workout_likes = list(WorkoutLike.objects(workout=ObjectId(workout_id)).as_pymongo())
+        users = get_user_summaries(like['user'] for like in workout_likes)
         likes_data = [{
-                "user_id": str(like.user.id),
-                "username": like.user.username,
-                "profilePhotoUrl": like.user.profilePhotoUrl,
-                "timestamp": like.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            } for like in workout_likes]
+                "user_id": str(like['user']),
+                "username": users[like['user']]['username'],
+                "profilePhotoUrl": users[like['user']]['profilePhotoUrl'],
+                "timestamp": like['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+            } for like in workout_likes if like['user'] in users]
 
         return jsonify(likes_data), 200
     except ValidationError:
@@ -1,34 +1,185 @@
-from flask import Blueprint, jsonify
+import os
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from mongoengine import ValidationError
 
-from fitness_app.models import Notification
+from fitness_app.models import Notification, Workout, Achievement, User
+from fitness_app.utils.batch_loader import load_references
+from fitness_app.utils.cursor import decode_cursor, encode_cursor, keyset_filter
+from fitness_app.utils.notification_hub import hub
+from fitness_app.utils.notifications import mark_notifications_read
 from fitness_app.utils.serializer import serialize_doc
+from fitness_app.utils.user_summary_cache import get_user_summaries
 
 notifications_bp = Blueprint('notifications', __name__)
 
+# Number of initiators embedded in a coalesced notification ("A, B and 40 others")
+SHOWN_INITIATORS = 3
+# Seconds between heartbeat comments on an idle stream, and after which a stream is closed
+# so that connections are rebalanced across workers; clients reconnect with their Last-Event-ID
+STREAM_HEARTBEAT_SECONDS = int(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', 15))
+STREAM_MAX_SECONDS = int(os.getenv('NOTIFICATION_STREAM_MAX_SECONDS', 300))
+# Number of missed notifications loaded per query when a stream resumes
+STREAM_REPLAY_LIMIT = 50
+
+
+def _shown_initiators(notification):
+    return notification.get('initiators', [notification['initiator']])[:SHOWN_INITIATORS]
+
+
+def _serialize_notifications(notifications, workout_fields=('name', 'imageUrl')):
+    """Serializes raw notification rows, loading the referenced documents with one query per collection."""
+    initiators = get_user_summaries(initiator_id for notification in notifications
+                                    for initiator_id in [notification['initiator'], *_shown_initiators(notification)])
+    workouts = load_references(notifications, 'targetWorkout', Workout, workout_fields)
+    achievements = load_references(notifications, 'targetAchievement', Achievement, ('name', 'description'))
+
+    return [{
+        "_id": notification['_id'],
+        "action": notification['action'],
+        "timestamp": notification['timestamp'],
+        "read": notification.get('read', True),
+        "initiator": initiators[notification['initiator']],
+        # Coalesced likes and comments: total number of events and the most recent people
+        "count": notification.get('count', 1),
+        "initiators": [initiators[initiator_id] for initiator_id in _shown_initiators(notification)
+                       if initiator_id in initiators],
+        "targetWorkout": serialize_doc(workouts[notification['targetWorkout']])
+        if notification.get('targetWorkout') in workouts else None,
+        "targetAchievement": serialize_doc(achievements[notification['targetAchievement']])
+        if notification.get('targetAchievement') in achievements else None,
+        # Include other relevant data based on action type
+    } for notification in notifications if notification['initiator'] in initiators]
+
 
 @notifications_bp.route('/all', methods=['GET'])
 @jwt_required()
 def get_notifications():
     current_user_id = get_jwt_identity()
+    # Clients sending neither limit nor after get the original unpaginated array
+    legacy = 'limit' not in request.args and 'after' not in request.args
+    limit = int(request.args.get('limit', 20))
+
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_cursor(after, datetime, ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     try:
-        # Fetch notifications where the current user is the target of the action
-        notifications = Notification.objects(user=current_user_id).order_by('-timestamp')
-        notifications_data = [{
-            "_id": notification.id,
-            "action": notification.action,
-            "timestamp": notification.timestamp,
-            "initiator": {
-                "_id": str(notification.initiator.id),
-                "username": notification.initiator.username,
-                "profilePhotoUrl": notification.initiator.profilePhotoUrl
-            },
-            "targetWorkout": serialize_doc(notification.targetWorkout.to_mongo().to_dict()) if notification.targetWorkout else None,
-            # Include other relevant data based on action type
-        } for notification in notifications]
-
-        return jsonify(notifications_data), 200
+        # Fetch notifications where the current user is the target of the action, newest first
+        query = {'user': ObjectId(current_user_id)}
+        if legacy:
+            notifications = list(Notification.objects(__raw__=query).order_by('-timestamp', '-id').as_pymongo())
+            return jsonify(_serialize_notifications(notifications, workout_fields=None)), 200
+        if after:
+            query = {'$and': [query, keyset_filter('timestamp', after[0], after[1])]}
+        notifications = list(Notification.objects(__raw__=query).order_by('-timestamp', '-id')
+                             .limit(limit + 1).as_pymongo())
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+        next_cursor = encode_cursor(notifications[-1]['timestamp'], notifications[-1]['_id']) if notifications else None
+
+        notifications_data = _serialize_notifications(notifications)
+
+        return jsonify({
+            'notifications': notifications_data,
+            'hasMore': has_more,
+            'nextCursor': next_cursor
+        }), 200
     except ValidationError as e:
         return jsonify({"error": str(e)}), 400
+    except InvalidId:
+        return jsonify({"error": "Invalid user_id"}), 400
+
+
+@notifications_bp.route('/unread', methods=['GET'])
+@jwt_required()
+def get_unread_count():
+    current_user_id = get_jwt_identity()
+    user = User.objects(id=ObjectId(current_user_id)).only('unreadNotifications').as_pymongo().first()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"unreadCount": user.get('unreadNotifications', 0)}), 200
+
+
+@notifications_bp.route('/read', methods=['POST'])
+@jwt_required()
+def mark_read():
+    """Marks the notifications listed in the optional JSON body {"ids": [...]} as read, or all of them."""
+    current_user_id = get_jwt_identity()
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    try:
+        notification_ids = [ObjectId(notification_id) for notification_id in ids] if ids is not None else None
+    except (InvalidId, TypeError):
+        return jsonify({"error": "Invalid notification id"}), 400
+
+    unread = mark_notifications_read(ObjectId(current_user_id), notification_ids)
+    return jsonify({"unreadCount": unread}), 200
+
+
+def _sse_event(notification):
+    event_id = encode_cursor(notification['timestamp'], notification['_id'])
+    return f"id: {event_id}\nevent: notification\ndata: {current_app.json.dumps(notification)}\n\n"
+
+
+@notifications_bp.route('/stream', methods=['GET'])
+@jwt_required()
+def stream_notifications():
+    """
+    Streams the current user's new and updated notifications as Server-Sent Events.
+
+    A client resuming with the Last-Event-ID header (or the lastEventId query parameter) first
+    receives the notifications it missed since that event.
+    """
+    user_id = ObjectId(get_jwt_identity())
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    if last_event_id:
+        try:
+            last_event_id = decode_cursor(last_event_id, datetime, ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    def events():
+        # Subscribe before replaying so nothing published in between is lost
+        subscription = hub.subscribe(user_id)
+        try:
+            yield f"retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n"
+            last_key = tuple(last_event_id) if last_event_id else None
+            # Replays the missed notifications page by page until a page comes back short
+            while last_key:
+                missed = list(Notification.objects(__raw__={'$and': [
+                    {'user': user_id}, keyset_filter('timestamp', last_key[0], last_key[1], descending=False)
+                ]}).order_by('timestamp', 'id').limit(STREAM_REPLAY_LIMIT).as_pymongo())
+                for notification in _serialize_notifications(missed):
+                    yield _sse_event(notification)
+                if missed:
+                    last_key = (missed[-1]['timestamp'], missed[-1]['_id'])
+                if len(missed) < STREAM_REPLAY_LIMIT:
+                    break
+
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            # A subscription that overflowed its buffer is closed, the client resumes from its last event
+            while time.monotonic() < deadline and not subscription.overflowed:
+                message = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                notification = Notification.objects(id=ObjectId(message['notification']), user=user_id) \
+                    .as_pymongo().first()
+                if not notification or (last_key and (notification['timestamp'], notification['_id']) <= last_key):
+                    # Deleted since, or already sent by the replay
+                    continue
+                for serialized in _serialize_notifications([notification]):
+                    yield _sse_event(serialized)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,10 +1,16 @@
 from datetime import datetime
 
+from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from mongoengine.errors import ValidationError, DoesNotExist
+from mongoengine.errors import ValidationError, NotUniqueError
 
-from fitness_app.models import User, Workout, UserReport, WorkoutReport, Block, Follow, WorkoutLike, WorkoutComment, Notification
+from fitness_app.models import User, Workout, UserReport, WorkoutReport, Block, Follow, WorkoutLike, WorkoutComment
+from fitness_app.utils.block_cache import invalidate_blocked_user_ids
+from fitness_app.utils.notifications import remove_notifications, refresh_coalesced_notifications
+from fitness_app.utils.reconcile_workout_counters import reconcile_workout_counters
+from fitness_app.utils.timeline import remove_author_from_timeline
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -13,83 +19,95 @@ reports_bp = Blueprint('reports', __name__)
 @reports_bp.route('/report_user/<user_id>', methods=['POST'])
 @jwt_required()
 def report_user(user_id):
-    reporter_id = get_jwt_identity()
     try:
-        reporter = User.objects.get(id=reporter_id)
-        reported = User.objects.get(id=user_id)
-
-        if UserReport.objects(reporter=reporter, reported=reported).first():
-            return jsonify({"message": "User already reported."}), 400
+        reporter_id = ObjectId(get_jwt_identity())
+        reported_id = ObjectId(user_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user ID."}), 400
+    if not User.objects(id=reported_id).count(with_limit_and_skip=True):
+        return jsonify({"error": "Invalid user ID."}), 400
 
-        report_data = request.json
-        reason = report_data.get('reason', 'No reason provided')
+    report_data = request.json
+    reason = report_data.get('reason', 'No reason provided')
 
-        new_report = UserReport(
-            reporter=reporter,
-            reported=reported,
+    # The unique (reporter, reported) index rejects a second report, also from concurrent retries
+    try:
+        UserReport(
+            reporter=reporter_id,
+            reported=reported_id,
             reason=reason,
             timestamp=datetime.utcnow()
-        )
-        new_report.save()
+        ).save(force_insert=True)
+    except NotUniqueError:
+        return jsonify({"message": "User already reported."}), 400
 
-        return jsonify({"message": "User reported successfully."}), 200
-    except (ValidationError, DoesNotExist):
-        return jsonify({"error": "Invalid user ID."}), 400
+    return jsonify({"message": "User reported successfully."}), 200
 
 
 # Report a workout
 @reports_bp.route('/report_workout/<workout_id>', methods=['POST'])
 @jwt_required()
 def report_workout(workout_id):
-    reporter_id = get_jwt_identity()
     try:
-        reporter = User.objects.get(id=reporter_id)
-        workout = Workout.objects.get(id=workout_id)
-
-        if WorkoutReport.objects(reporter=reporter, workout=workout).first():
-            return jsonify({"message": "Workout already reported."}), 400
+        reporter_id = ObjectId(get_jwt_identity())
+        workout_id = ObjectId(workout_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid workout ID."}), 400
+    if not Workout.objects(id=workout_id).count(with_limit_and_skip=True):
+        return jsonify({"error": "Invalid workout ID."}), 400
 
-        report_data = request.json
-        reason = report_data.get('reason', 'No reason provided')
+    report_data = request.json
+    reason = report_data.get('reason', 'No reason provided')
 
-        new_report = WorkoutReport(
-            reporter=reporter,
-            workout=workout,
+    # The unique (reporter, workout) index rejects a second report, also from concurrent retries
+    try:
+        WorkoutReport(
+            reporter=reporter_id,
+            workout=workout_id,
             reason=reason,
             timestamp=datetime.utcnow()
-        )
-        new_report.save()
+        ).save(force_insert=True)
+    except NotUniqueError:
+        return jsonify({"message": "Workout already reported."}), 400
 
-        return jsonify({"message": "Workout reported successfully."}), 200
-    except (ValidationError, DoesNotExist):
-        return jsonify({"error": "Invalid workout ID."}), 400
+    return jsonify({"message": "Workout reported successfully."}), 200
 
 
 @reports_bp.route('/block_user/<blocked_user_id>', methods=['POST'])
 @jwt_required()
 def block_user(blocked_user_id):
-    blocking_user_id = get_jwt_identity()
     try:
-        blocking_user = User.objects.get(id=blocking_user_id)
-        blocked_user = User.objects.get(id=blocked_user_id)
+        blocking_id = ObjectId(get_jwt_identity())
+        blocked_id = ObjectId(blocked_user_id)
+    except InvalidId:
+        return jsonify({"error": "Invalid user ID."}), 400
 
-        # Check if already blocked
-        if Block.objects(blocking=blocking_user, blocked=blocked_user).first():
-            return jsonify({"message": "User already blocked."}), 400
+    try:
+        if not User.objects(id=blocked_id).count(with_limit_and_skip=True):
+            return jsonify({"error": "Invalid user ID."}), 400
 
-        # Create a new block entry
-        block_entry = Block(blocking=blocking_user, blocked=blocked_user)
-        block_entry.save()
+        # Create a new block entry, the unique (blocking, blocked) index rejects a second one
+        try:
+            Block(blocking=blocking_id, blocked=blocked_id).save(force_insert=True)
+        except NotUniqueError:
+            return jsonify({"message": "User already blocked."}), 400
+        invalidate_blocked_user_ids(blocking_id, blocked_id)
 
         # Remove follows, likes, and comments from blocker to blocked
-        Follow.objects(followed=blocked_user, follower=blocking_user).delete()
-        Follow.objects(followed=blocking_user, follower=blocked_user).delete()
-        WorkoutLike.objects(user=blocking_user, workout__in=Workout.objects(user=blocked_user)).delete()
-        WorkoutLike.objects(user=blocked_user, workout__in=Workout.objects(user=blocking_user)).delete()
-        WorkoutComment.objects(user=blocking_user, workout__in=Workout.objects(user=blocked_user)).delete()
-        WorkoutComment.objects(user=blocked_user, workout__in=Workout.objects(user=blocking_user)).delete()
-        Notification.objects(user=blocking_user, initiator=blocked_user).delete()
-        Notification.objects(user=blocked_user, initiator=blocking_user).delete()
+        Follow.objects(followed=blocked_id, follower=blocking_id).delete()
+        Follow.objects(followed=blocking_id, follower=blocked_id).delete()
+        blocked_workout_ids = list(Workout.objects(user=blocked_id).scalar('id'))
+        blocking_workout_ids = list(Workout.objects(user=blocking_id).scalar('id'))
+        WorkoutLike.objects(user=blocking_id, workout__in=blocked_workout_ids).delete()
+        WorkoutLike.objects(user=blocked_id, workout__in=blocking_workout_ids).delete()
+        WorkoutComment.objects(user=blocking_id, workout__in=blocked_workout_ids).delete()
+        WorkoutComment.objects(user=blocked_id, workout__in=blocking_workout_ids).delete()
+        reconcile_workout_counters(blocked_workout_ids + blocking_workout_ids)
+        remove_notifications(user=blocking_id, initiator=blocked_id, bucket=None)
+        remove_notifications(user=blocked_id, initiator=blocking_id, bucket=None)
+        refresh_coalesced_notifications(blocked_workout_ids + blocking_workout_ids)
+        remove_author_from_timeline(blocking_id, blocked_id)
+        remove_author_from_timeline(blocked_id, blocking_id)
 
 
         return jsonify({"message": "User blocked successfully."}), 200
@@ -12,7 +12,7 @@ routines_bp = Blueprint('routines', __name__)
 @jwt_required()
 def fetch_routines():
     user_id = get_jwt_identity()
-    routines = Routine.objects(user=ObjectId(user_id)).first()
+    routines = Routine.objects(user=ObjectId(user_id))
     return jsonify([serialize_doc(routine.to_mongo().to_dict()) for routine in routines])
 
 
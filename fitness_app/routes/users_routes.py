@@ -4,13 +4,28 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, unset_jwt_cookies
 from mongoengine import DoesNotExist
 
 from fitness_app.models import User, Workout, Routine, Follow, WorkoutLike, WorkoutComment, Notification, \
-    AchievementGained, UserReport, WorkoutReport, Block
+    AchievementGained, UserReport, WorkoutReport, UserStats
+from fitness_app.utils.block_cache import get_blocked_user_ids
+from fitness_app.utils.cursor import decode_cursor
+from fitness_app.utils.http_cache import content_hashed_response
+from fitness_app.utils.notifications import remove_notifications, refresh_coalesced_notifications
+from fitness_app.utils.reconcile_workout_counters import reconcile_workout_counters
 from fitness_app.utils.responses import error_response, success_response
-from fitness_app.utils.serializer import serialize_documents, serialize_doc
+from fitness_app.utils.timeline import delete_user_timelines
+from fitness_app.utils.user_profile import build_full_profile, build_profile_summary
+from fitness_app.utils.user_search import search_users
+from fitness_app.utils.user_summary_cache import invalidate_user_summaries
 
 users_bp = Blueprint('users', __name__)
 
 
+def _build_profile(user):
+    # The unbounded legacy dump is only sent when explicitly requested
+    if request.args.get('full', 'false').lower() == 'true':
+        return build_full_profile(user)
+    return build_profile_summary(user)
+
+
 @users_bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_user_profile():
@@ -19,21 +34,7 @@ def get_user_profile():
     if not user:
         return error_response("User not found", 401)
 
-    user_data = {
-        "_id": str(user.id),
-        "username": user.username,
-        "birthDate": user.birthDate,
-        "registrationDate": user.registrationDate,
-        "profilePhotoUrl": user.profilePhotoUrl,
-        "lastStreakEvidence": user.lastStreakEvidence,
-        "streak": user.streak,
-        "restDays": user.restDays,
-        "workouts": serialize_documents(Workout.objects(user=ObjectId(user_id))),
-        "routines": serialize_documents(Routine.objects(user=ObjectId(user_id))),
-        "followers": serialize_documents(Follow.objects(followed=ObjectId(user_id))),
-        "following": serialize_documents(Follow.objects(follower=ObjectId(user_id))),
-    }
-    return success_response(user_data, 200)
+    return content_hashed_response(success_response(_build_profile(user), 200))
 
 
 @users_bp.route('/user/<user_id>', methods=['GET'])
@@ -43,21 +44,8 @@ def get_user_profile_by_id(user_id):
     user = User.objects(id=user_id).first()
     if not user:
         return error_response("User not found", 401)
-    user_data = {
-        "_id": str(user.id),
-        "username": user.username,
-        "birthDate": user.birthDate,
-        "registrationDate": user.registrationDate,
-        "profilePhotoUrl": user.profilePhotoUrl,
-        "lastStreakEvidence": user.lastStreakEvidence,
-        "streak": user.streak,
-        "restDays": user.restDays,
-        "workouts": serialize_documents(Workout.objects(user=ObjectId(user_id))),
-        "routines": serialize_documents(Routine.objects(user=ObjectId(user_id))),
-        "followers": serialize_documents(Follow.objects(followed=ObjectId(user_id))),
-        "following": serialize_documents(Follow.objects(follower=ObjectId(user_id))),
-    }
-    return success_response(user_data, 200)
+
+    return content_hashed_response(success_response(_build_profile(user), 200))
 
 
 @users_bp.route("/all", methods=["GET"])
@@ -70,28 +58,23 @@ def fetch_users():
     skip = (page - 1) * limit
 
     # Get IDs of users who are blocked or have blocked the current user
-    blocked_users_ids = [str(block.blocked.id) for block in Block.objects(blocking=user_id)] + \
-                        [str(block.blocking.id) for block in Block.objects(blocked=user_id)]
+    blocked_users_ids = get_blocked_user_ids(user_id)
 
-    query = {}
-    if username_query:
-        query['username'] = {'$regex': username_query, '$options': 'i'}
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_cursor(after, int, (str, type(None)), ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     try:
-        users_query = User.objects(__raw__=query, id__ne=ObjectId(user_id), id__nin=blocked_users_ids).skip(skip).limit(limit)
-        users = list(users_query)
-        # Serialize users to include username and profilePhotoUrl
-        user_data = [{
-            "_id": str(user.id),
-            "username": user.username,
-            "profilePhotoUrl": user.profilePhotoUrl
-        } for user in users]
-        total_users = User.objects(__raw__=query, id__ne=ObjectId(user_id), id__nin=blocked_users_ids).count()
-        has_more = skip + limit < total_users
+        user_data, has_more, next_cursor = search_users(
+            username_query, [ObjectId(user_id), *blocked_users_ids], limit=limit, skip=skip, after=after)
 
         return jsonify({
             'users': user_data,
-            'hasMore': has_more
+            'hasMore': has_more,
+            'nextCursor': next_cursor
         }), 200
     except Exception as e:
         print(e)
@@ -105,20 +88,29 @@ def delete_account():
     try:
         user = User.objects.get(id=user_id)
 
+        # Workouts of other users whose like/comment counters drop with this account
+        engaged_workout_ids = {like['workout'] for like in WorkoutLike.objects(user=user).only('workout').as_pymongo()} | \
+                              {comment['workout'] for comment in WorkoutComment.objects(user=user).only('workout').as_pymongo()}
+
         WorkoutLike.objects(user=user).delete()
         WorkoutComment.objects(user=user).delete()
         Notification.objects(user=user).delete()
-        Notification.objects(initiator=user).delete()
+        remove_notifications(initiator=user.id, bucket=None)
+        refresh_coalesced_notifications(engaged_workout_ids)
         AchievementGained.objects(user=user).delete()
         Follow.objects(followed=user).delete()
         Follow.objects(follower=user).delete()
         Routine.objects(user=user).delete()
+        UserStats.objects(user=user).delete()
+        delete_user_timelines(user.id)
         Workout.objects(user=user).delete()
         UserReport.objects(reporter=user).delete()
         UserReport.objects(reported=user).delete()
         WorkoutReport.objects(reporter=user).delete()
 
         user.delete()
+        invalidate_user_summaries(user.id)
+        reconcile_workout_counters(engaged_workout_ids)
 
         response = jsonify({"msg": "User account deleted successfully."})
         unset_jwt_cookies(response)
@@ -1,14 +1,24 @@
 from datetime import datetime
 
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import Blueprint, request, jsonify, json
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from fitness_app.models import Workout, User, WorkoutLike, WorkoutComment, Follow, Notification, Block
+from fitness_app.models import Workout, User, Timeline
 from mongoengine.errors import ValidationError
 
-from fitness_app.utils.serializer import serialize_doc
+from fitness_app.utils.achievement_catalog import evaluate_user_achievements
+from fitness_app.utils.block_cache import get_blocked_user_ids
+from fitness_app.utils.cursor import decode_cursor
+from fitness_app.utils.feed_query import fetch_feed_page, fetch_timeline_page, fetch_engagement
+from fitness_app.utils.notifications import remove_notifications
+from fitness_app.utils.reset_user_streaks import streak_expiry
+from fitness_app.utils.task_queue import enqueue
+from fitness_app.utils.timeline import fan_out_workout, followed_fanout_on_read_ids, rebuild_timeline, \
+    remove_workout_from_timelines
 from fitness_app.utils.upload_workout_image import upload_workout_image
+from fitness_app.utils.user_stats import record_workout, remove_workout
 from fitness_app.utils.validate_and_get_file import validate_and_get_file
 
 workouts_bp = Blueprint('workouts', __name__)
@@ -23,39 +33,87 @@ def fetch_workouts():
     skip = (page - 1) * limit
     feed_type = request.args.get('feedType', 'global')  # Default to 'global' if not specified
 
-    # Get IDs of users who are blocked or have blocked the current user
-    blocked_users_ids = [str(block.blocked.id) for block in Block.objects(blocking=user_id)] + \
-                        [str(block.blocking.id) for block in Block.objects(blocked=user_id)]
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_cursor(after, datetime, ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     try:
         if feed_type == 'followed':
-            # Fetch only from followed users, excluding blocked users
-            followed_users_ids = [str(follow.followed.id) for follow in Follow.objects(follower=user_id)]
-            valid_followed_ids = [uid for uid in followed_users_ids if uid not in blocked_users_ids]
-            workouts_query = Workout.objects(user__in=valid_followed_ids).order_by('-timestamp').skip(skip).limit(limit)
+            # Unfollows and blocks are already applied to the materialized timeline on write
+            owner_id = ObjectId(user_id)
+            fanout_on_read_ids = followed_fanout_on_read_ids(owner_id)
+            enhanced_workouts, has_more, next_cursor = fetch_timeline_page(
+                owner_id, skip=skip, limit=limit, after=after, fanout_on_read_ids=fanout_on_read_ids,
+                viewer_id=owner_id)
+            # Workouts merged in from fan-out-on-read accounts do not show whether the timeline exists
+            if not after and not skip and (not enhanced_workouts or fanout_on_read_ids) \
+                    and not Timeline._get_collection().count_documents({'user': owner_id}, limit=1):
+                # First followed feed read of this user, build the timeline from their follows
+                rebuild_timeline(owner_id)
+                enhanced_workouts, has_more, next_cursor = fetch_timeline_page(
+                    owner_id, limit=limit, fanout_on_read_ids=fanout_on_read_ids, viewer_id=owner_id)
         else:
             # Exclude blocked users and the user themselves from the global feed
-            workouts_query = Workout.objects(user__nin=blocked_users_ids + [user_id]).order_by('-timestamp').skip(skip).limit(limit)
-
-        enhanced_workouts = []
-        for workout in workouts_query:
-            workout_data = serialize_doc(workout.to_mongo().to_dict())
-            likes_count = WorkoutLike.objects(workout=workout.id).count()
-            comments_count = WorkoutComment.objects(workout=workout.id).count()
-            workout_data.update({'likesCount': likes_count, 'commentsCount': comments_count})
-            enhanced_workouts.append(workout_data)
-
-        total_workouts_count = workouts_query.count()
-        has_more = skip + limit < total_workouts_count
+            match = {'user': {'$nin': [*get_blocked_user_ids(user_id), ObjectId(user_id)]}}
+            enhanced_workouts, has_more, next_cursor = fetch_feed_page(
+                match, skip=skip, limit=limit, after=after, viewer_id=ObjectId(user_id))
 
         return jsonify({
             'workouts': enhanced_workouts,
-            'hasMore': has_more
+            'hasMore': has_more,
+            'nextCursor': next_cursor
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@workouts_bp.route("/user/<user_id>", methods=["GET"])
+@jwt_required()
+def fetch_user_workouts(user_id):
+    limit = int(request.args.get('limit', 10))
+
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_cursor(after, datetime, ObjectId)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    try:
+        workouts, has_more, next_cursor = fetch_feed_page(
+            {'user': ObjectId(user_id)}, limit=limit, after=after, viewer_id=ObjectId(get_jwt_identity()))
+    except InvalidId:
+        return jsonify({"error": "Invalid user_id"}), 400
+
+    return jsonify({
+        'workouts': workouts,
+        'hasMore': has_more,
+        'nextCursor': next_cursor
+    }), 200
+
+
+# Maximum number of workouts accepted by one engagement request
+MAX_ENGAGEMENT_IDS = 100
+
+
+@workouts_bp.route("/engagement", methods=["GET"])
+@jwt_required()
+def fetch_workouts_engagement():
+    """Returns counts, likedByMe and commentedByMe for the comma separated workout IDs in `ids`."""
+    ids = [workout_id for workout_id in request.args.get('ids', '').split(',') if workout_id]
+    if len(ids) > MAX_ENGAGEMENT_IDS:
+        return jsonify({"error": f"At most {MAX_ENGAGEMENT_IDS} workout IDs are allowed"}), 400
+    try:
+        workout_ids = [ObjectId(workout_id) for workout_id in ids]
+    except InvalidId:
+        return jsonify({"error": "Invalid workout ID"}), 400
+
+    return jsonify(fetch_engagement(ObjectId(get_jwt_identity()), workout_ids)), 200
+
+
 @workouts_bp.route("/save", methods=["POST"])
 @jwt_required()
 def save_workout():
@@ -80,6 +138,7 @@ def save_workout():
             # Update streak and last workout date
             user.streak += 1
             user.lastStreakEvidence = current_date
+            user.streakExpiresOn = streak_expiry(current_date)
             user.save()
 
     imageUrl = None
@@ -100,6 +159,9 @@ def save_workout():
         imageUrl=imageUrl
     )
     workout.save()
+    record_workout(workout, user.streak)
+    fan_out_workout(workout)
+    enqueue(evaluate_user_achievements, user.id)
 
     return jsonify({"message": "Workout saved successfully", "workout_id": str(workout.id)}), 200
 
@@ -111,8 +173,10 @@ def delete_workout(workout_id):
     try:
         workout = Workout.objects.get(id=workout_id, user=user_id)
         # Delete related notifications before deleting the workout
-        Notification.objects(targetWorkout=workout).delete()
+        remove_notifications(targetWorkout=workout.id)
+        remove_workout_from_timelines(workout.id)
         workout.delete()
+        remove_workout(workout)
         return jsonify({"message": "Workout and related notifications deleted successfully"}), 200
     except Workout.DoesNotExist:
         return jsonify({"error": "Workout not found or not authorized to delete"}), 404
@@ -0,0 +1,118 @@
+import hashlib
+import os
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from fitness_app.models import User, Achievement, AchievementGained
+from fitness_app.utils.notifications import create_notifications
+from fitness_app.utils.ttl_cache import TTLCache
+from fitness_app.utils.user_stats import get_user_stats
+
+# Achievements are edited directly in the database, so the TTL bounds how long a change takes to show up
+_catalog_cache = TTLCache(maxsize=1, ttl=int(os.getenv('ACHIEVEMENT_CATALOG_TTL', 300)))
+
+DIMENSIONS = ('streak', 'workouts', 'minutes')
+
+
+class AchievementCatalog:
+    """The achievement catalog compiled into one sorted threshold table per dimension."""
+
+    def __init__(self, achievements):
+        self.achievements = {achievement['_id']: achievement for achievement in achievements}
+        self.version = hashlib.sha1(json_util.dumps(achievements, sort_keys=True).encode()).hexdigest()
+
+        requirements = {achievement_id: {
+            'streak': max((condition.get('streakNumber', 0) for condition in achievement['conditions']), default=0),
+            'workouts': max((condition.get('workoutsNumber', 0) for condition in achievement['conditions']), default=0),
+            'minutes': max((condition.get('minutes', 0) for condition in achievement['conditions']), default=0),
+        } for achievement_id, achievement in self.achievements.items()}
+        self._requirements = requirements
+
+        self._thresholds = {}
+        self._ids = {}
+        for dimension in DIMENSIONS:
+            table = sorted((required[dimension], str(achievement_id), achievement_id)
+                           for achievement_id, required in requirements.items())
+            self._thresholds[dimension] = [threshold for threshold, _, _ in table]
+            self._ids[dimension] = [achievement_id for _, _, achievement_id in table]
+
+    def reached(self, streak, workouts, minutes):
+        """Returns the ids of every achievement whose thresholds are met by the given values."""
+        values = {'streak': streak, 'workouts': workouts, 'minutes': minutes}
+        cutoffs = {dimension: bisect_right(self._thresholds[dimension], values[dimension])
+                   for dimension in DIMENSIONS}
+        narrowest = min(DIMENSIONS, key=cutoffs.get)
+        return [achievement_id for achievement_id in self._ids[narrowest][:cutoffs[narrowest]]
+                if all(self._requirements[achievement_id][dimension] <= values[dimension]
+                       for dimension in DIMENSIONS)]
+
+
+def _load_catalog():
+    achievements = list(Achievement._get_collection().find({}, {'name': 1, 'description': 1, 'conditions': 1}))
+    return AchievementCatalog(achievements)
+
+
+def get_achievement_catalog():
+    """Returns the compiled achievement catalog, loading it when it is missing or expired."""
+    return _catalog_cache.get_or_load('catalog', _load_catalog)
+
+
+def invalidate_achievement_catalog():
+    _catalog_cache.clear()
+
+
+def award_achievements(user_id, streak, workouts, minutes):
+    """
+    Inserts an AchievementGained and a notification for every achievement the user reached but has not gained yet.
+
+    Args:
+        user_id: The user's ObjectId.
+        streak: The user's current streak.
+        workouts: The user's number of workouts.
+        minutes: The user's total workout minutes.
+
+    Returns:
+        A list of the newly gained achievement dicts.
+    """
+    catalog = get_achievement_catalog()
+    reached = catalog.reached(streak, workouts, minutes)
+    if not reached:
+        return []
+
+    gained = AchievementGained.objects(user=user_id, achievement__in=reached).only('achievement').as_pymongo()
+    gained_ids = {gain['achievement'] for gain in gained}
+    new_ids = [achievement_id for achievement_id in reached if achievement_id not in gained_ids]
+    if not new_ids:
+        return []
+
+    now = datetime.now(timezone.utc)
+    documents = [{'user': user_id, 'achievement': achievement_id, 'timestamp': now, 'reported': False}
+                 for achievement_id in new_ids]
+    try:
+        AchievementGained._get_collection().insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        rejected = {error['index'] for error in e.details.get('writeErrors', [])}
+        new_ids = [achievement_id for index, achievement_id in enumerate(new_ids) if index not in rejected]
+
+    if new_ids:
+        create_notifications([{
+            'user': user_id,
+            'initiator': user_id,
+            'action': 'achievement',
+            'targetAchievement': achievement_id,
+            'timestamp': now,
+        } for achievement_id in new_ids])
+
+    return [catalog.achievements[achievement_id] for achievement_id in new_ids]
+
+
+def evaluate_user_achievements(user_id):
+    """Awards the achievements the user reached with their current streak and workout stats."""
+    user = User.objects(id=user_id).only('streak').as_pymongo().first()
+    if not user:
+        return []
+    stats = get_user_stats(user_id)
+    return award_achievements(user['_id'], user.get('streak', 0), stats['workoutsCount'], stats['totalMinutes'])
@@ -0,0 +1,30 @@
+USER_SUMMARY_FIELDS = ('username', 'profilePhotoUrl')
+
+
+def load_references(rows, field, model, fields=None):
+    """
+    Loads the documents referenced by a page of rows with one `$in` query instead of one query per row.
+
+    Args:
+        rows: Raw documents (e.g. from `as_pymongo()`) holding ObjectId references in `field`.
+        field: Name of the reference field.
+        model: The referenced Document class.
+        fields: Field names to project. All fields are loaded when omitted.
+
+    Returns:
+        A dict mapping each referenced ObjectId to its raw document. Missing documents are left out.
+    """
+    ids = list({row[field] for row in rows if row.get(field) is not None})
+    if not ids:
+        return {}
+    projection = {name: 1 for name in fields} if fields else None
+    return {doc['_id']: doc for doc in model._get_collection().find({'_id': {'$in': ids}}, projection)}
+
+
+def user_summary(user):
+    """Returns the public _id, username and profilePhotoUrl of a raw user document."""
+    return {
+        "_id": str(user['_id']),
+        "username": user.get('username'),
+        "profilePhotoUrl": user.get('profilePhotoUrl')
+    }
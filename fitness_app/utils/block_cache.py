@@ -0,0 +1,34 @@
+import os
+
+from bson import ObjectId
+
+from fitness_app.models import Block
+from fitness_app.utils.ttl_cache import TTLCache
+
+_blocked_users = TTLCache(maxsize=10000, ttl=int(os.getenv('BLOCK_CACHE_TTL', 300)))
+
+
+def _load_blocked_user_ids(user_id):
+    blocks = Block._get_collection().find(
+        {'$or': [{'blocking': user_id}, {'blocked': user_id}]},
+        {'_id': 0, 'blocking': 1, 'blocked': 1}
+    )
+    return frozenset(block['blocked'] if block['blocking'] == user_id else block['blocking'] for block in blocks)
+
+
+def get_blocked_user_ids(user_id):
+    """
+    Returns the users who are blocked by or have blocked the given user.
+
+    Args:
+        user_id: The user's ID as a string or ObjectId.
+
+    Returns:
+        A frozenset of ObjectIds, served from an in-process cache when possible.
+    """
+    user_id = ObjectId(user_id)
+    return _blocked_users.get_or_load(user_id, lambda: _load_blocked_user_ids(user_id))
+
+
+def invalidate_blocked_user_ids(*user_ids):
+    _blocked_users.invalidate(*(ObjectId(user_id) for user_id in user_ids))
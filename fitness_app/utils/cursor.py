@@ -0,0 +1,47 @@
+import base64
+import binascii
+
+from bson import json_util
+
+
+def encode_cursor(*values):
+    """
+    Encodes the sort key values of the last returned document into an opaque cursor.
+
+    Args:
+        values: The sort key values, ending with the document's `_id` as a tiebreaker.
+
+    Returns:
+        A URL-safe string to be passed back as the `after` query parameter.
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    Args:
+        cursor: The cursor string received from the client.
+        types: The expected type (or tuple of types) of each sort key value, in order.
+
+    Returns:
+        A list of the sort key values.
+
+    Raises:
+        ValueError: If the cursor is malformed or holds values of other types.
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(types) or \
+            not all(isinstance(value, expected) for value, expected in zip(values, types)):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_filter(field, value, doc_id, descending=True):
+    """Builds the filter seeking past (value, doc_id) on an index sorted by (field, _id)."""
+    op = '$lt' if descending else '$gt'
+    return {'$or': [{field: {op: value}}, {field: value, '_id': {op: doc_id}}]}
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+
+from bson import json_util
+
+from fitness_app.models import BodyPart, Equipment, Exercise
+from fitness_app.utils.exercise_search import ExerciseSearchIndex
+from fitness_app.utils.serializer import serialize_doc
+from fitness_app.utils.ttl_cache import TTLCache
+
+# Exercises, body parts and equipment only change through data imports, so the TTL bounds how long
+# an import takes to show up unless invalidate_exercise_catalog() is called
+_catalog_cache = TTLCache(maxsize=1, ttl=int(os.getenv('EXERCISE_CATALOG_TTL', 3600)))
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+class ExerciseCatalog:
+    """An immutable in-memory snapshot of the exercise catalog."""
+
+    def __init__(self, exercises, body_parts, equipment):
+        exercises = sorted(exercises, key=lambda exercise: exercise['_id'])
+        self.ids = [exercise['_id'] for exercise in exercises]
+        self.names = [exercise.get('name', '') for exercise in exercises]
+        self._folded_names = [name.casefold() for name in self.names]
+        self.rows = [_dumps(serialize_doc(dict(exercise))) for exercise in exercises]
+        self._positions_by_id = {str(exercise_id): position for position, exercise_id in enumerate(self.ids)}
+        self.search_index = ExerciseSearchIndex(exercises)
+
+        self.by_body_part = {}
+        self.by_equipment = {}
+        for position, exercise in enumerate(exercises):
+            self.by_body_part.setdefault(str(exercise.get('bodyPart')), []).append(position)
+            self.by_equipment.setdefault(str(exercise.get('equipment')), []).append(position)
+
+        self.body_parts_json = _dumps([serialize_doc(dict(body_part)) for body_part in body_parts])
+        self.equipment_json = _dumps([serialize_doc(dict(eq)) for eq in equipment])
+        # Single documents keep the extended JSON format of Document.to_json()
+        self.body_part_by_id = {str(body_part['_id']): json_util.dumps(body_part) for body_part in body_parts}
+        self.equipment_by_id = {str(eq['_id']): json_util.dumps(eq) for eq in equipment}
+
+        digest = hashlib.sha1()
+        for part in (*self.rows, self.body_parts_json, self.equipment_json):
+            digest.update(part.encode('utf-8'))
+        self.version = digest.hexdigest()
+
+    def exercise_json(self, exercise_id):
+        """Returns the serialized exercise, or None if it does not exist."""
+        position = self._positions_by_id.get(exercise_id)
+        return self.rows[position] if position is not None else None
+
+    def _candidates(self, body_part, equipment):
+        lists = []
+        if body_part:
+            lists.append(self.by_body_part.get(body_part, []))
+        if equipment:
+            lists.append(self.by_equipment.get(equipment, []))
+        if not lists:
+            return range(len(self.ids))
+        if len(lists) == 1:
+            return lists[0]
+        smaller, larger = sorted(lists, key=len)
+        larger = set(larger)
+        return [position for position in smaller if position in larger]
+
+    def page(self, body_part=None, equipment=None, name_query=None, skip=0, limit=20, after=None):
+        """
+        Returns one page of exercises in `_id` order.
+
+        Args:
+            body_part: Body part ID string to filter by.
+            equipment: Equipment ID string to filter by.
+            name_query: Text the exercise name must contain, ignoring case.
+            skip: Number of matching exercises to skip. Ignored when `after` is given.
+            limit: Maximum number of exercises to return.
+            after: `_id` of the last exercise already seen.
+
+        Returns:
+            A tuple of (serialized JSON rows, has_more, `_id` of the last returned exercise or None).
+        """
+        candidates = self._candidates(body_part, equipment)
+        # Matched as a literal: a client supplied regular expression could backtrack for minutes
+        name_query = name_query.casefold() if name_query else None
+        start = 0
+        if after:
+            # Positions follow `_id` order, so the cursor maps to a position in every candidate list
+            start = bisect_left(candidates, bisect_right(self.ids, after))
+            skip = 0
+
+        page = []
+        for index in range(start, len(candidates)):
+            position = candidates[index]
+            if name_query and name_query not in self._folded_names[position]:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            page.append(position)
+            if len(page) > limit:
+                break
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        last_id = self.ids[page[-1]] if page else None
+        return [self.rows[position] for position in page], has_more, last_id
+
+    def search(self, query, body_part=None, equipment=None, skip=0, limit=20):
+        """Returns one page of exercises matching the query, most relevant first, and has_more."""
+        positions = set(self._candidates(body_part, equipment)) if body_part or equipment else None
+        ranked = self.search_index.search(query, skip + limit + 1, positions)
+        return [self.rows[position] for position in ranked[skip:skip + limit]], len(ranked) > skip + limit
+
+    def suggest(self, query, limit=10):
+        """Returns {_id, name} of the best exercises completing the query being typed."""
+        ranked = self.search_index.search(query, limit, prefix_all=False)
+        return [{'_id': str(self.ids[position]), 'name': self.names[position]} for position in ranked]
+
+
+def _load_catalog():
+    return ExerciseCatalog(
+        list(Exercise._get_collection().find()),
+        list(BodyPart._get_collection().find()),
+        list(Equipment._get_collection().find()),
+    )
+
+
+def get_exercise_catalog():
+    """Returns the exercise catalog snapshot, loading it when it is missing or expired."""
+    return _catalog_cache.get_or_load('catalog', _load_catalog)
+
+
+def invalidate_exercise_catalog():
+    """Drops the snapshot after the catalog changed, the next request loads a fresh one."""
+    _catalog_cache.clear()
+
+
+def warm_exercise_catalog():
+    """Loads the snapshot ahead of the first request. Failures are logged and retried on first use."""
+    try:
+        get_exercise_catalog()
+    except Exception:
+        logger.exception('Loading the exercise catalog failed')
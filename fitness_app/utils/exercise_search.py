@@ -0,0 +1,169 @@
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter
+
+# Weight of a match in each searchable exercise field
+FIELD_WEIGHTS = (('name', 3.0), ('target', 2.0), ('secondaryMuscles', 1.0))
+# Score factors of a prefix and a fuzzy (trigram) match relative to an exact token match
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.6
+# In search, shorter tokens only match exactly, a single letter being a prefix of a large part of the
+# vocabulary. The last token of an autocomplete query is matched as a prefix from its first letter.
+MIN_PREFIX_LENGTH = 2
+# Minimum trigram similarity of a misspelled token, and the shortest token we try to correct
+MIN_SIMILARITY = 0.3
+MIN_FUZZY_LENGTH = 3
+# Similarity given to tokens one typo (insertion, deletion, substitution or swap) apart, which
+# trigrams alone score low on short words ("bnech" shares only 2 of 10 trigrams with "bench")
+ONE_TYPO_SIMILARITY = 0.75
+# Bonus for exercises whose name starts with the whole query
+NAME_PREFIX_BONUS = 1.0
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Splits text into lowercase alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower()) if isinstance(text, str) else []
+
+
+def _one_typo_apart(a, b):
+    if abs(len(a) - len(b)) > 1:
+        return False
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    return (a[1:] == b[1:] or a[1:] == b or a == b[1:]
+            or (len(a) == len(b) >= 2 and a[0] == b[1] and a[1] == b[0] and a[2:] == b[2:]))
+
+
+def _trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ExerciseSearchIndex:
+    """Ranked, typo-tolerant full-text search over the exercises of a catalog snapshot."""
+
+    def __init__(self, exercises):
+        self.names = [exercise.get('name') or '' for exercise in exercises]
+        self._normalized_names = [' '.join(tokenize(name)) for name in self.names]
+
+        postings = {}
+        for position, exercise in enumerate(exercises):
+            for field, weight in FIELD_WEIGHTS:
+                values = exercise.get(field)
+                for value in values if isinstance(values, list) else [values]:
+                    for token in tokenize(value):
+                        entry = postings.setdefault(token, {})
+                        if weight > entry.get(position, 0):
+                            entry[position] = weight
+        self._postings = postings
+        # Sorted vocabulary, the tokens starting with a prefix form one contiguous range in it
+        self._vocabulary = sorted(postings)
+
+        self._trigram_index = {}
+        self._trigram_counts = []
+        for vocabulary_index, token in enumerate(self._vocabulary):
+            trigrams = _trigrams(token)
+            self._trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self._trigram_index.setdefault(trigram, []).append(vocabulary_index)
+
+    def _prefixed(self, prefix):
+        start = bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def _similar(self, token):
+        trigrams = _trigrams(token)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigram_index.get(trigram, ()))
+        for vocabulary_index, count in shared.items():
+            candidate = self._vocabulary[vocabulary_index]
+            # Jaccard similarity of the trigram sets
+            similarity = count / (len(trigrams) + self._trigram_counts[vocabulary_index] - count)
+            if count >= 2 and similarity < ONE_TYPO_SIMILARITY and _one_typo_apart(token, candidate):
+                similarity = ONE_TYPO_SIMILARITY
+            if similarity >= MIN_SIMILARITY:
+                yield candidate, similarity
+
+    def _token_scores(self, token, min_prefix_length, within=None):
+        factors = {}
+        if token in self._postings:
+            factors[token] = 1.0
+        if len(token) >= min_prefix_length:
+            for candidate in self._prefixed(token):
+                factors.setdefault(candidate, PREFIX_FACTOR)
+        if not factors and len(token) >= MIN_FUZZY_LENGTH:
+            for candidate, similarity in self._similar(token):
+                factors[candidate] = FUZZY_FACTOR * similarity
+
+        scores = {}
+        for candidate, factor in factors.items():
+            postings = self._postings[candidate]
+            if within is not None and len(within) < len(postings):
+                postings = {position: postings[position] for position in within if position in postings}
+            for position, weight in postings.items():
+                score = weight * factor
+                if score > scores.get(position, 0):
+                    scores[position] = score
+        return scores
+
+    def search(self, query, limit, positions=None, prefix_all=True):
+        """
+        Ranks the exercises matching every token of the query.
+
+        Args:
+            query: The search text.
+            limit: Maximum number of results.
+            positions: Optional set of catalog positions to restrict the results to.
+            prefix_all: Match every query token as a prefix. When False only the last token is, from
+                its first letter on, which is what autocomplete of a query being typed needs.
+
+        Returns:
+            Catalog positions ordered by descending relevance, ties broken by shorter name.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        last = len(tokens) - 1
+
+        def min_prefix_length(index):
+            if prefix_all:
+                return MIN_PREFIX_LENGTH
+            return 1 if index == last else float('inf')
+
+        def selectivity(item):
+            index, token = item
+            # The autocomplete prefix goes last, by then the other tokens have narrowed the candidates
+            return (not prefix_all and index == last and last > 0, len(self._postings.get(token, ())))
+
+        scores = None
+        # Rarest tokens first, so the candidate set shrinks as early as possible
+        for index, token in sorted(enumerate(tokens), key=selectivity):
+            token_scores = self._token_scores(token, min_prefix_length(index), scores)
+            if scores is None:
+                scores = token_scores if positions is None else \
+                    {position: score for position, score in token_scores.items() if position in positions}
+            else:
+                scores = {position: score + token_scores[position] for position, score in scores.items()
+                          if position in token_scores}
+            if not scores:
+                return []
+
+        phrase = ' '.join(tokens)
+        # Whole words only, a name merely starting with a longer word is already ranked as a prefix match
+        phrase_words = phrase + ' '
+        for position in scores:
+            name = self._normalized_names[position]
+            if name == phrase or name.startswith(phrase_words):
+                scores[position] += NAME_PREFIX_BONUS
+        return heapq.nsmallest(limit, scores, key=lambda position: (-scores[position], len(self.names[position]),
+                                                                    position))
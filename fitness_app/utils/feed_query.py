@@ -0,0 +1,156 @@
+from fitness_app.models import Workout, Timeline, WorkoutLike, WorkoutComment
+from fitness_app.utils.cursor import encode_cursor, keyset_filter
+from fitness_app.utils.serializer import serialize_doc
+
+# Workouts saved before the counters existed have no fields until reconciled
+_COUNTER_DEFAULTS = {'$set': {
+    'likesCount': {'$ifNull': ['$likesCount', 0]},
+    'commentsCount': {'$ifNull': ['$commentsCount', 0]},
+}}
+
+
+def _engagement_stages(viewer_id):
+    stages = []
+    for field, model in (('likedByMe', WorkoutLike), ('commentedByMe', WorkoutComment)):
+        stages += [
+            {'$lookup': {
+                'from': model._get_collection_name(),
+                'let': {'workout_id': '$_id'},
+                'pipeline': [
+                    {'$match': {'$expr': {'$and': [
+                        {'$eq': ['$user', viewer_id]},
+                        {'$eq': ['$workout', '$$workout_id']},
+                    ]}}},
+                    {'$limit': 1},
+                    {'$project': {'_id': 1}},
+                ],
+                'as': field,
+            }},
+            {'$set': {field: {'$gt': [{'$size': f'${field}'}, 0]}}},
+        ]
+    return stages
+
+
+def _to_page(workouts, limit):
+    has_more = len(workouts) > limit
+    workouts = workouts[:limit]
+    next_cursor = encode_cursor(workouts[-1]['timestamp'], workouts[-1]['_id']) if workouts else None
+    return [serialize_doc(workout) for workout in workouts], has_more, next_cursor
+
+
+def fetch_feed_page(match, skip=0, limit=10, after=None, viewer_id=None):
+    """
+    Fetches one page of the workout feed with a single aggregation round trip.
+
+    Args:
+        match: The `$match` filter selecting which workouts belong to the feed.
+        skip: Number of workouts to skip. Ignored when `after` is given.
+        limit: Maximum number of workouts to return.
+        after: Decoded (timestamp, _id) cursor of the last workout already seen.
+        viewer_id: When given, each workout also says whether this user liked and commented on it.
+
+    Returns:
+        A tuple of (serialized workouts with like/comment counts, has_more, next_cursor).
+    """
+    if after:
+        # Seeking on (timestamp, _id) keeps pages stable while new workouts are inserted
+        match = {'$and': [match, keyset_filter('timestamp', after[0], after[1])]}
+        skip = 0
+
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'timestamp': -1, '_id': -1}},
+    ]
+    if skip:
+        pipeline.append({'$skip': skip})
+    # One extra row tells us whether another page exists without a count() query
+    pipeline += [
+        {'$limit': limit + 1},
+        _COUNTER_DEFAULTS,
+    ]
+    if viewer_id:
+        pipeline += _engagement_stages(viewer_id)
+
+    return _to_page(list(Workout.objects.aggregate(pipeline)), limit)
+
+
+def fetch_timeline_page(user_id, skip=0, limit=10, after=None, fanout_on_read_ids=(), viewer_id=None):
+    """
+    Fetches one page of a user's materialized timeline with a single aggregation round trip.
+
+    Args:
+        user_id: ObjectId of the timeline owner.
+        skip: Number of workouts to skip. Ignored when `after` is given.
+        limit: Maximum number of workouts to return.
+        after: Decoded (timestamp, _id) cursor of the last workout already seen.
+        fanout_on_read_ids: Followed accounts that are not fanned out on write; their
+            workouts are read from the workouts collection and merged in.
+        viewer_id: When given, each workout also says whether this user liked and commented on it.
+
+    Returns:
+        A tuple of (serialized workouts with like/comment counts, has_more, next_cursor).
+    """
+    keyset = {}
+    if after:
+        keyset = keyset_filter('timestamp', after[0], after[1])
+        skip = 0
+
+    pipeline = [
+        {'$match': {'user': user_id}},
+        {'$unwind': '$entries'},
+        {'$project': {'_id': '$entries.workout', 'timestamp': '$entries.timestamp'}},
+        {'$match': keyset},
+    ]
+    if fanout_on_read_ids:
+        pipeline += [
+            {'$unionWith': {
+                'coll': Workout._get_collection_name(),
+                'pipeline': [
+                    {'$match': {'$and': [{'user': {'$in': list(fanout_on_read_ids)}}, keyset]}},
+                    {'$sort': {'timestamp': -1, '_id': -1}},
+                    {'$limit': skip + limit + 1},
+                    {'$project': {'timestamp': 1}},
+                ],
+            }},
+            # Workouts fanned out before their author switched to fan-out-on-read appear twice
+            {'$group': {'_id': '$_id', 'timestamp': {'$first': '$timestamp'}}},
+        ]
+    pipeline.append({'$sort': {'timestamp': -1, '_id': -1}})
+    if skip:
+        pipeline.append({'$skip': skip})
+    pipeline += [
+        {'$limit': limit + 1},
+        {'$lookup': {
+            'from': Workout._get_collection_name(),
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'workout',
+        }},
+        {'$unwind': '$workout'},
+        {'$replaceRoot': {'newRoot': '$workout'}},
+        _COUNTER_DEFAULTS,
+    ]
+    if viewer_id:
+        pipeline += _engagement_stages(viewer_id)
+
+    return _to_page(list(Timeline.objects.aggregate(pipeline)), limit)
+
+
+def fetch_engagement(viewer_id, workout_ids):
+    """
+    Fetches like/comment counts and the viewer's own engagement for a set of workouts in one aggregation.
+
+    Args:
+        viewer_id: ObjectId of the user asking.
+        workout_ids: ObjectIds of the workouts.
+
+    Returns:
+        A dict mapping workout id strings to dicts with likesCount, commentsCount, likedByMe and commentedByMe.
+    """
+    pipeline = [
+        {'$match': {'_id': {'$in': list(workout_ids)}}},
+        {'$project': {'likesCount': 1, 'commentsCount': 1}},
+        _COUNTER_DEFAULTS,
+        *_engagement_stages(viewer_id),
+    ]
+    return {str(row.pop('_id')): row for row in Workout.objects.aggregate(pipeline)}
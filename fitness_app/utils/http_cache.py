@@ -0,0 +1,47 @@
+import hashlib
+import os
+
+from flask import request, make_response, current_app
+
+# Seconds clients and the CDN may reuse catalog responses (exercises, achievements) without revalidating
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', 300))
+
+CATALOG_CACHE_CONTROL = f'public, max-age={CATALOG_CACHE_MAX_AGE}'
+# Per-user responses may only be stored by the client, and must be revalidated on every use
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+
+def versioned_response(version, build, cache_control=CATALOG_CACHE_CONTROL):
+    """
+    Answers a conditional GET of a resource whose contents are identified by a version.
+
+    When the client's If-None-Match holds the version, a 304 is returned without calling build.
+
+    Args:
+        version: Strong ETag of the resource, e.g. the version hash of the catalog it is served from.
+        build: Callable returning the response for a client without a current copy.
+        cache_control: Cache-Control header of the response.
+
+    Returns:
+        The response carrying the ETag and Cache-Control headers.
+    """
+    if request.if_none_match.contains_weak(version):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build())
+    response.set_etag(version)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def content_hashed_response(response, cache_control=PRIVATE_CACHE_CONTROL):
+    """
+    Tags a successful response with an ETag hashed from its body and turns it into a 304 when the
+    client already has that body. Used where no cheap version exists, so it saves bandwidth only.
+    """
+    response = make_response(response)
+    if response.status_code == 200:
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = cache_control
+        response.make_conditional(request)
+    return response
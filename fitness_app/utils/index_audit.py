@@ -0,0 +1,154 @@
+import os
+
+from bson import ObjectId
+
+from fitness_app.models import User, Achievement, AchievementGained, Follow, BodyPart, Equipment, Exercise, Routine, \
+    Workout, Timeline, WorkoutLike, WorkoutComment, Notification, UserReport, WorkoutReport, Block, UserStats, JobLock, \
+    JobRun
+from fitness_app.utils.notifications import remove_notifications
+
+MODELS = (User, Achievement, AchievementGained, Follow, BodyPart, Equipment, Exercise, Routine, Workout, Timeline,
+          WorkoutLike, WorkoutComment, Notification, UserReport, WorkoutReport, Block, UserStats, JobLock, JobRun)
+
+# Relations whose write routes rely on a unique index to reject duplicates, also from concurrent retries
+WRITE_GUARD_MODELS = (WorkoutLike, Follow, Block)
+
+# Read notifications older than this many days are removed by a TTL index on timestamp. Unread ones
+# are kept, deleting them would leave the recipients' unread counters too high
+NOTIFICATION_TTL_DAYS = int(os.getenv('NOTIFICATION_TTL_DAYS', 90))
+NOTIFICATION_TTL_FILTER = {'read': True}
+
+_ID = ObjectId()
+
+# (description, model, filter, sort) of the query behind each hot route
+CANONICAL_QUERIES = (
+    ('GET /workouts/all global feed', Workout, {'user': {'$nin': [_ID]}}, [('timestamp', -1), ('_id', -1)]),
+    ('GET /workouts/all followed feed', Timeline, {'user': _ID}, None),
+    ('fan-out-on-read workouts', Workout, {'user': {'$in': [_ID]}}, [('timestamp', -1), ('_id', -1)]),
+    ('fan-out-on-read accounts', User, {'fanoutOnRead': True}, None),
+    ('timeline repair by workout', Timeline, {'entries.workout': _ID}, None),
+    ('timeline repair by author', Timeline, {'entries.author': _ID}, None),
+    ('GET /users/all prefix match', User, {'searchKey': {'$regex': '^abc'}}, [('searchKey', 1), ('_id', 1)]),
+    ('GET /users/all infix match', User, {'searchGrams': {'$all': ['abc', 'bcd']}}, None),
+    ('GET /users/user workouts', Workout, {'user': _ID}, None),
+    ('GET /users/user routines', Routine, {'user': _ID}, None),
+    ('GET /follows followers', Follow, {'followed': _ID}, None),
+    ('GET /follows following', Follow, {'follower': _ID}, None),
+    ('POST /follows/follow', Follow, {'followed': _ID, 'follower': _ID}, None),
+    ('GET /likes', WorkoutLike, {'workout': _ID}, None),
+    ('POST /likes/like', WorkoutLike, {'user': _ID, 'workout': _ID}, None),
+    ('DELETE /users/delete_account likes', WorkoutLike, {'user': _ID}, None),
+    ('GET /comments', WorkoutComment, {'workout': _ID}, None),
+    ('DELETE /users/delete_account comments', WorkoutComment, {'user': _ID}, None),
+    ('GET /notifications/all', Notification, {'user': _ID}, [('timestamp', -1), ('_id', -1)]),
+    ('GET /notifications/unread', Notification, {'user': _ID, 'read': False}, None),
+    ('POST /likes/like coalesced notification', Notification,
+     {'user': _ID, 'action': 'like', 'targetWorkout': _ID, 'bucket': {'$exists': True}}, None),
+    ('DELETE /workouts/delete notifications', Notification, {'targetWorkout': _ID}, None),
+    ('POST /reports/block_user notifications', Notification, {'user': _ID, 'initiator': _ID}, None),
+    ('blocks of user', Block, {'blocking': _ID}, None),
+    ('blocks against user', Block, {'blocked': _ID}, None),
+    ('GET /achievements', AchievementGained, {'user': _ID}, None),
+    ('POST /reports/report_user', UserReport, {'reporter': _ID, 'reported': _ID}, None),
+    ('POST /reports/report_workout', WorkoutReport, {'reporter': _ID, 'workout': _ID}, None),
+    ('GET /exercises/exercise by body part', Exercise, {'bodyPart': _ID}, [('_id', 1)]),
+    ('GET /exercises/exercise by equipment', Exercise, {'equipment': _ID}, [('_id', 1)]),
+)
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def remove_duplicate_relations():
+    """
+    Deletes duplicate documents that would prevent the unique compound indexes from being built,
+    keeping the oldest document of each duplicate group. Partial indexes only consider the documents
+    matching their partialFilterExpression.
+
+    Returns:
+        A dict mapping collection names to the number of deleted documents.
+    """
+    removed = {}
+    for model in MODELS:
+        for spec in model._meta['index_specs']:
+            if not spec.get('unique') or len(spec['fields']) < 2:
+                continue
+            group_key = {field.replace('.', '_'): f'${field}' for field, _ in spec['fields']}
+            pipeline = [
+                {'$match': spec.get('partialFilterExpression', {})},
+                {'$sort': {'_id': 1}},
+                {'$group': {'_id': group_key, 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}},
+            ]
+            duplicate_ids = [doc_id for group in model._get_collection().aggregate(pipeline, allowDiskUse=True)
+                             for doc_id in group['ids'][1:]]
+            if not duplicate_ids:
+                continue
+            if model is Notification:
+                # Keeps the recipients' unread counters in step
+                deleted = remove_notifications(id__in=duplicate_ids)
+            else:
+                deleted = model._get_collection().delete_many({'_id': {'$in': duplicate_ids}}).deleted_count
+            name = model._get_collection_name()
+            removed[name] = removed.get(name, 0) + deleted
+    return removed
+
+
+def ensure_all_indexes():
+    """Creates the indexes declared in the meta of every model and the notification TTL index."""
+    for model in MODELS:
+        model.ensure_indexes()
+    ensure_notification_ttl()
+
+
+def ensure_write_guard_indexes():
+    """Creates the indexes of WRITE_GUARD_MODELS, which the like, follow and block routes need to stay idempotent."""
+    for model in WRITE_GUARD_MODELS:
+        model.ensure_indexes()
+
+
+def ensure_notification_ttl(days=NOTIFICATION_TTL_DAYS):
+    """
+    Creates the TTL index expiring old read notifications, or changes its age with collMod when it differs.
+
+    The index is not declared in the model meta, where a changed age would conflict with the existing index.
+    """
+    collection = Notification._get_collection()
+    seconds = days * 24 * 60 * 60
+    for name, index in collection.index_information().items():
+        if index['key'] == [('timestamp', 1)]:
+            if index.get('partialFilterExpression') != NOTIFICATION_TTL_FILTER:
+                # The filter of an index cannot be changed in place
+                collection.drop_index(name)
+                break
+            if index.get('expireAfterSeconds') != seconds:
+                collection.database.command('collMod', collection.name,
+                                            index={'name': name, 'expireAfterSeconds': seconds})
+            return
+    collection.create_index([('timestamp', 1)], expireAfterSeconds=seconds,
+                            partialFilterExpression=NOTIFICATION_TTL_FILTER)
+
+
+def explain_canonical_queries():
+    """
+    Runs explain() on the canonical query of each route.
+
+    Returns:
+        A list of (description, stages, uses_collscan) tuples, one per canonical query.
+    """
+    results = []
+    for description, model, query, sort in CANONICAL_QUERIES:
+        cursor = model._get_collection().find(query).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = list(_plan_stages(cursor.explain().get('queryPlanner', {}).get('winningPlan', {})))
+        results.append((description, stages, 'COLLSCAN' in stages))
+    return results
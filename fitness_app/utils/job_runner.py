@@ -0,0 +1,94 @@
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timezone, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from fitness_app.models import JobLock, JobRun
+
+# Identifies this process as a lease owner in jobLocks and jobRuns
+OWNER = f'{socket.gethostname()}:{os.getpid()}'
+
+# Runs starting later than this after their fire time are skipped as misfired
+MISFIRE_GRACE_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+def acquire_job_lease(name, run_key, lease_seconds):
+    """
+    Atomically takes the lease of a job for one run.
+
+    The lease is granted only if no other process holds an unexpired lease and the run
+    identified by run_key has not been started yet, so each run executes exactly once.
+
+    Returns:
+        True if this process acquired the lease.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        JobLock._get_collection().find_one_and_update(
+            {'_id': name, 'lastRunKey': {'$ne': run_key},
+             '$or': [{'expiresAt': None}, {'expiresAt': {'$lte': now}}]},
+            {'$set': {'owner': OWNER, 'lastRunKey': run_key, 'expiresAt': now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lock document exists but did not match, so somebody else holds this run
+        return False
+
+
+def scheduled_run_key(trigger, now=None):
+    """Identifies a run by the fire time of the trigger it belongs to, which is the same in every process."""
+    now = now or datetime.now(timezone.utc)
+    fire_time = trigger.get_next_fire_time(None, now - timedelta(seconds=MISFIRE_GRACE_SECONDS))
+    return fire_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M')
+
+
+def release_job_lease(name):
+    JobLock.objects(name=name, owner=OWNER).update_one(set__expiresAt=datetime.now(timezone.utc))
+
+
+def run_job(name, func, kwargs=None, lease_seconds=3600, trigger=None):
+    """
+    Runs a scheduled job if this process wins its lease and records the run in jobRuns.
+
+    Args:
+        name: The job's unique name.
+        func: The job function. It may return a dict with a 'modified' count of touched rows.
+        kwargs: Keyword arguments passed to func.
+        lease_seconds: How long the lease is held before another process may take over a crashed run.
+        trigger: The APScheduler trigger firing the job. Runs of other processes firing late for the same
+            fire time are then skipped; without it the run is identified by the current minute.
+
+    Returns:
+        The job's result, or None if the run was skipped or failed.
+    """
+    run_key = scheduled_run_key(trigger) if trigger else datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M')
+    if not acquire_job_lease(name, run_key, lease_seconds):
+        logger.info('Skipping job %s run %s, it is handled by another process', name, run_key)
+        return None
+
+    run = JobRun(job=name, runKey=run_key, owner=OWNER, status='running',
+                 startedAt=datetime.now(timezone.utc)).save()
+    started = time.monotonic()
+    result = None
+    try:
+        result = func(**(kwargs or {}))
+        run.status = 'succeeded'
+        if isinstance(result, dict):
+            run.result = result
+            run.rowsTouched = result.get('modified')
+    except Exception as e:
+        logger.exception('Job %s failed', name)
+        run.status = 'failed'
+        run.error = str(e)
+    finally:
+        run.finishedAt = datetime.now(timezone.utc)
+        run.durationMs = int((time.monotonic() - started) * 1000)
+        run.save()
+        release_job_lease(name)
+    return result
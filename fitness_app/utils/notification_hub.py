@@ -0,0 +1,173 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from mongoengine.connection import get_db
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+# Messages buffered per stream connection; a connection that falls further behind is closed
+# and the client catches up by reconnecting with its Last-Event-ID
+STREAM_BUFFER_SIZE = int(os.getenv('NOTIFICATION_STREAM_BUFFER', 100))
+# Size in bytes of the capped collection carrying messages between processes
+PUBSUB_COLLECTION_SIZE = int(os.getenv('NOTIFICATION_PUBSUB_SIZE', 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPubSubBackend:
+    """Delivers published messages to the subscribers of the current process only."""
+
+    def __init__(self):
+        self._handler = None
+
+    def start(self, handler):
+        self._handler = handler
+
+    def publish(self, user_id, message):
+        self._handler(user_id, message)
+
+
+class MongoPubSubBackend:
+    """Delivers published messages to the subscribers of every process through a capped collection."""
+
+    def __init__(self, collection_name='notificationEvents', size=PUBSUB_COLLECTION_SIZE, retry_seconds=1):
+        self.collection_name = collection_name
+        self.size = size
+        self.retry_seconds = retry_seconds
+        self._handler = None
+        self._cached_collection = None
+        self._lock = threading.Lock()
+
+    def _collection(self):
+        # Created once per process, so that publishing stays a single insert
+        if self._cached_collection is None:
+            with self._lock:
+                if self._cached_collection is None:
+                    db = get_db()
+                    try:
+                        db.create_collection(self.collection_name, capped=True, size=self.size)
+                    except CollectionInvalid:
+                        pass  # Already exists
+                    self._cached_collection = db[self.collection_name]
+        return self._cached_collection
+
+    def start(self, handler):
+        self._handler = handler
+        threading.Thread(target=self._listen, name='notification-pubsub', daemon=True).start()
+
+    def publish(self, user_id, message):
+        self._collection().insert_one({'user': user_id, 'message': message})
+
+    def _listen(self):
+        last_id = None
+        started = False
+        while True:
+            try:
+                collection = self._collection()
+                if not started:
+                    # Only messages published from now on are delivered
+                    newest = collection.find_one({}, sort=[('$natural', -1)])
+                    last_id = newest['_id'] if newest else None
+                    started = True
+                last_id = self._tail(collection, last_id)
+            except Exception:
+                logger.exception('Following the notification pub/sub collection failed')
+            # The tailable cursor dies at once on an empty collection, and after errors
+            time.sleep(self.retry_seconds)
+
+    def _tail(self, collection, last_id):
+        cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+        # Documents up to last_id were delivered before, those after it are buffered until it is found
+        caught_up = last_id is None
+        pending = []
+        while cursor.alive:
+            document = cursor.try_next()
+            if document is None:
+                if not caught_up:
+                    # last_id was overwritten while disconnected, everything still in the collection is new
+                    for missed in pending:
+                        self._handler(missed['user'], missed['message'])
+                    if pending:
+                        last_id = pending[-1]['_id']
+                    caught_up = True
+                    pending = []
+                continue
+            if not caught_up:
+                if document['_id'] == last_id:
+                    caught_up = True
+                    pending = []
+                else:
+                    pending.append(document)
+                continue
+            self._handler(document['user'], document['message'])
+            last_id = document['_id']
+        return last_id
+
+
+class Subscription:
+    """A bounded buffer of the messages published to one user for one stream connection."""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def offer(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Returns the next message, or None if none arrived within timeout seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class NotificationHub:
+    def __init__(self, backend, buffer_size=STREAM_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.set_backend(backend)
+
+    def set_backend(self, backend):
+        self._backend = backend
+        backend.start(self._deliver)
+
+    def publish(self, user_id, message):
+        self._backend.publish(str(user_id), message)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(str(user_id), self.buffer_size)
+        with self._lock:
+            self._subscriptions[subscription.user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.offer(message)
+
+
+hub = NotificationHub(LocalPubSubBackend())
+
+
+def publish_notification(user_id, notification_id):
+    """Tells the user's open notification streams that a notification was created or updated."""
+    hub.publish(user_id, {'notification': str(notification_id)})
@@ -0,0 +1,173 @@
+import os
+from datetime import datetime, timezone, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from fitness_app.models import Notification, User, WorkoutLike, WorkoutComment
+from fitness_app.utils.notification_hub import publish_notification
+
+# Likes and comments on a workout within one bucket of this many hours share a notification
+NOTIFICATION_BUCKET_HOURS = int(os.getenv('NOTIFICATION_BUCKET_HOURS', 24))
+# Number of most recent distinct initiators kept on a coalesced notification
+MAX_INITIATORS = 10
+
+_COALESCED_SOURCES = {'like': WorkoutLike, 'comment': WorkoutComment}
+
+
+def _adjust_unread(counts):
+    operations = [UpdateOne({'_id': user_id}, [{'$set': {'unreadNotifications': {'$max': [
+        0, {'$add': [{'$ifNull': ['$unreadNotifications', 0]}, delta]}
+    ]}}}]) for user_id, delta in counts.items() if delta]
+    if operations:
+        User._get_collection().bulk_write(operations, ordered=False)
+
+
+def create_notifications(documents):
+    """Inserts notifications and increments the unread counter of each recipient."""
+    if not documents:
+        return
+    now = datetime.now(timezone.utc)
+    documents = [{'timestamp': now, **document, 'read': False} for document in documents]
+    result = Notification._get_collection().insert_many(documents, ordered=False)
+
+    counts = {}
+    for document in documents:
+        counts[document['user']] = counts.get(document['user'], 0) + 1
+    _adjust_unread(counts)
+
+    for document, notification_id in zip(documents, result.inserted_ids):
+        publish_notification(document['user'], notification_id)
+
+
+def create_notification(user_id, initiator_id, action, target_workout_id=None):
+    """Notifies user_id that initiator_id performed action, optionally on a workout."""
+    document = {'user': user_id, 'initiator': initiator_id, 'action': action}
+    if target_workout_id is not None:
+        document['targetWorkout'] = target_workout_id
+    create_notifications([document])
+
+
+def remove_notifications(**filters):
+    """Deletes the matching notifications, decrements the unread counters and returns the number deleted."""
+    unread = Notification.objects(read=False, **filters).aggregate([
+        {'$group': {'_id': '$user', 'count': {'$sum': 1}}},
+    ])
+    counts = {row['_id']: -row['count'] for row in unread}
+    deleted = Notification.objects(**filters).delete()
+    _adjust_unread(counts)
+    return deleted
+
+
+def mark_notifications_read(user_id, notification_ids=None):
+    """Marks the user's notifications (or only the given ones) as read and returns the remaining unread count."""
+    query = Notification.objects(user=user_id, read=False)
+    if notification_ids is not None:
+        query = query.filter(id__in=notification_ids)
+    query.update(set__read=True)
+
+    unread = Notification.objects(user=user_id, read=False).count()
+    User.objects(id=user_id).update_one(set__unreadNotifications=unread)
+    return unread
+
+
+def notification_bucket(timestamp):
+    """Returns the start of the NOTIFICATION_BUCKET_HOURS bucket containing timestamp, naive values being UTC."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    span = NOTIFICATION_BUCKET_HOURS * 60 * 60
+    return datetime.fromtimestamp(timestamp.timestamp() // span * span, timezone.utc)
+
+
+def coalesce_notification(user_id, initiator_id, action, workout_id, timestamp):
+    """Adds a like or comment to the owner's aggregated notification of that workout and time bucket."""
+    query = {'user': user_id, 'action': action, 'targetWorkout': workout_id,
+             'bucket': notification_bucket(timestamp)}
+    write_id = ObjectId()
+    update = [{'$set': {
+        'markedUnreadBy': {'$cond': [{'$eq': ['$read', False]}, '$markedUnreadBy', write_id]},
+        'initiator': initiator_id,
+        'initiators': {'$slice': [{'$concatArrays': [
+            [initiator_id],
+            {'$filter': {'input': {'$ifNull': ['$initiators', []]}, 'cond': {'$ne': ['$$this', initiator_id]}}},
+        ]}, MAX_INITIATORS]},
+        'count': {'$add': [{'$ifNull': ['$count', 0]}, 1]},
+        'read': False,
+        'timestamp': datetime.now(timezone.utc),
+    }}]
+    collection = Notification._get_collection()
+    try:
+        after = collection.find_one_and_update(query, update, {'markedUnreadBy': 1}, upsert=True,
+                                               return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # A concurrent upsert created the document first, this update now matches it
+        after = collection.find_one_and_update(query, update, {'markedUnreadBy': 1},
+                                               return_document=ReturnDocument.AFTER)
+    # Only the write that created the notification or turned it unread again counts it
+    if after.get('markedUnreadBy') == write_id:
+        _adjust_unread({user_id: 1})
+
+    publish_notification(user_id, after['_id'])
+
+
+def _still_involved(initiator_id, action, workout_id, bucket):
+    return _COALESCED_SOURCES[action].objects(
+        user=initiator_id, workout=workout_id,
+        timestamp__gte=bucket, timestamp__lt=bucket + timedelta(hours=NOTIFICATION_BUCKET_HOURS)
+    ).count() > 0
+
+
+def uncoalesce_notification(user_id, initiator_id, action, workout_id, timestamp):
+    """Removes a deleted like or comment from its aggregated notification, deleting it when empty."""
+    bucket = notification_bucket(timestamp)
+    collection = Notification._get_collection()
+    update = [{'$set': {'count': {'$subtract': ['$count', 1]}}}]
+    if not _still_involved(initiator_id, action, workout_id, bucket):
+        # The latest remaining initiator becomes the notification's initiator
+        update += [
+            {'$set': {'initiators': {'$filter': {'input': '$initiators', 'cond': {'$ne': ['$$this', initiator_id]}}}}},
+            {'$set': {'initiator': {'$ifNull': [{'$arrayElemAt': ['$initiators', 0]}, '$initiator']}}},
+        ]
+    after = collection.find_one_and_update(
+        {'user': user_id, 'action': action, 'targetWorkout': workout_id, 'bucket': bucket, 'count': {'$gt': 0}},
+        update, {'count': 1, 'read': 1}, return_document=ReturnDocument.AFTER)
+    if after and after['count'] <= 0:
+        if collection.delete_one({'_id': after['_id'], 'count': {'$lte': 0}}).deleted_count and not after.get('read'):
+            _adjust_unread({user_id: -1})
+
+
+def refresh_coalesced_notifications(workout_ids):
+    """Recomputes the aggregated notifications of the given workouts from their remaining likes and comments."""
+    if not workout_ids:
+        return
+    collection = Notification._get_collection()
+    unread_removed = {}
+    for notification in collection.find({'targetWorkout': {'$in': list(workout_ids)}, 'bucket': {'$exists': True}},
+                                        {'user': 1, 'action': 1, 'targetWorkout': 1, 'bucket': 1, 'read': 1}):
+        source = _COALESCED_SOURCES.get(notification['action'])
+        if source is None:
+            continue
+        bucket = notification['bucket']
+        events = source._get_collection().find({
+            'workout': notification['targetWorkout'],
+            'user': {'$ne': notification['user']},
+            'timestamp': {'$gte': bucket, '$lt': bucket + timedelta(hours=NOTIFICATION_BUCKET_HOURS)},
+        }, {'user': 1}).sort('timestamp', -1)
+
+        count = 0
+        initiators = []
+        for event in events:
+            count += 1
+            if event['user'] not in initiators:
+                initiators.append(event['user'])
+
+        if not count:
+            collection.delete_one({'_id': notification['_id']})
+            if not notification.get('read'):
+                unread_removed[notification['user']] = unread_removed.get(notification['user'], 0) - 1
+        else:
+            collection.update_one({'_id': notification['_id']}, {'$set': {
+                'count': count, 'initiators': initiators[:MAX_INITIATORS], 'initiator': initiators[0],
+            }})
+    _adjust_unread(unread_removed)
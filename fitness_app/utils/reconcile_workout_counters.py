@@ -0,0 +1,70 @@
+import time
+
+from pymongo import UpdateOne
+
+from fitness_app.models import Workout, WorkoutLike, WorkoutComment
+
+
+def _count_by_workout(model, workout_ids):
+    pipeline = [
+        {'$match': {'workout': {'$in': workout_ids}}},
+        {'$group': {'_id': '$workout', 'count': {'$sum': 1}}},
+    ]
+    return {row['_id']: row['count'] for row in model.objects.aggregate(pipeline)}
+
+
+def _reconcile_batch(workouts):
+    workout_ids = [workout['_id'] for workout in workouts]
+    likes = _count_by_workout(WorkoutLike, workout_ids)
+    comments = _count_by_workout(WorkoutComment, workout_ids)
+
+    operations = []
+    for workout in workouts:
+        likes_count = likes.get(workout['_id'], 0)
+        comments_count = comments.get(workout['_id'], 0)
+        if workout.get('likesCount') == likes_count and workout.get('commentsCount') == comments_count:
+            continue
+        # Only overwrite if no $inc landed since we read the counters; the next run catches up otherwise
+        operations.append(UpdateOne(
+            {'_id': workout['_id'], 'likesCount': workout.get('likesCount'),
+             'commentsCount': workout.get('commentsCount')},
+            {'$set': {'likesCount': likes_count, 'commentsCount': comments_count}}
+        ))
+
+    if not operations:
+        return 0
+    return Workout._get_collection().bulk_write(operations, ordered=False).modified_count
+
+
+def reconcile_workout_counters(workout_ids=None, batch_size=500):
+    """
+    Recomputes the denormalized likesCount/commentsCount of workouts and fixes drifted ones.
+
+    Args:
+        workout_ids: Workouts to reconcile. All workouts are scanned when omitted.
+        batch_size: Number of workouts recounted per aggregation and bulk write.
+
+    Returns:
+        A dict with the number of scanned and modified workouts and the duration in milliseconds.
+    """
+    started = time.monotonic()
+    query = Workout.objects if workout_ids is None else Workout.objects(id__in=list(workout_ids))
+    rows = query.only('id', 'likesCount', 'commentsCount').order_by('id').as_pymongo().batch_size(batch_size)
+
+    scanned = modified = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            modified += _reconcile_batch(batch)
+            scanned += len(batch)
+            batch = []
+    if batch:
+        modified += _reconcile_batch(batch)
+        scanned += len(batch)
+
+    return {
+        'scanned': scanned,
+        'modified': modified,
+        'durationMs': int((time.monotonic() - started) * 1000),
+    }
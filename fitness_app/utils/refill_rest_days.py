@@ -1,9 +1,54 @@
+import logging
+import time
+from datetime import datetime
+
 from fitness_app.models import User
 
+REST_DAYS_PER_MONTH = 10
+
+logger = logging.getLogger(__name__)
+
+
+def refill_rest_days(today=None, batch_size=None):
+    """
+    Refills every user's rest days for the current month.
+
+    Users already refilled this month are skipped, so running the job twice in a month
+    does not give back rest days consumed in between.
+
+    Args:
+        today: The date the job runs for. Defaults to the current local date.
+        batch_size: When given, users are refilled in chunks of this many documents
+            instead of a single update_many over the whole collection.
+
+    Returns:
+        A dict with the matched and modified counts and the duration in milliseconds.
+    """
+    started = time.monotonic()
+    today = today or datetime.now().date()
+    month_start = datetime.combine(today.replace(day=1), datetime.min.time())
+
+    pending = {'$or': [{'restDaysRefilledOn': None}, {'restDaysRefilledOn': {'$lt': month_start}}]}
+    update = {'$set': {'restDays': REST_DAYS_PER_MONTH, 'restDaysRefilledOn': month_start}}
+    collection = User._get_collection()
 
-def refill_rest_days():
-    users = User.objects.all()
+    matched = modified = 0
+    if batch_size:
+        last_id = None
+        while True:
+            chunk_query = pending if last_id is None else {'$and': [pending, {'_id': {'$gt': last_id}}]}
+            ids = [user['_id'] for user in collection.find(chunk_query, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+            if not ids:
+                break
+            result = collection.update_many({'$and': [pending, {'_id': {'$in': ids}}]}, update)
+            matched += result.matched_count
+            modified += result.modified_count
+            last_id = ids[-1]
+    else:
+        result = collection.update_many(pending, update)
+        matched, modified = result.matched_count, result.modified_count
 
-    for user in users:
-        user.restDays = 10
-        user.save()
+    duration_ms = int((time.monotonic() - started) * 1000)
+    logger.info('Refilled rest days for %s: matched=%d modified=%d duration=%dms',
+                month_start.strftime('%Y-%m'), matched, modified, duration_ms)
+    return {'matched': matched, 'modified': modified, 'durationMs': duration_ms}
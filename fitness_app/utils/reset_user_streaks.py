@@ -1,17 +1,129 @@
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
 from fitness_app.models import User
 
+_ONE_DAY_MS = 24 * 60 * 60 * 1000
+
+
+def streak_expiry(evidence_date):
+    """Returns the last date a streak evidenced on evidence_date stays alive without another workout."""
+    return evidence_date + timedelta(days=1)
+
+
+def live_streak(user, today=None):
+    """
+    Returns the user's (streak, restDays) with the nightly resets that are due but not applied yet.
+
+    Args:
+        user: The User document.
+        today: The date to evaluate for. Defaults to the current local date.
+    """
+    today = today or datetime.now().date()
+    if not user.streak or not user.streakExpiresOn or user.streakExpiresOn >= today:
+        return user.streak, user.restDays
+    # Every overdue night consumes a rest day, the first night without one resets the streak
+    overdue_nights = (today - user.streakExpiresOn).days
+    if user.restDays >= overdue_nights:
+        return user.streak, user.restDays - overdue_nights
+    return 0, max(user.restDays - overdue_nights, 0)
+
+
+def _due_filter(today):
+    return {'streakExpiresOn': {'$lt': datetime.combine(today, datetime.min.time())}}
+
+
+# Covers the missed day with a rest day and moves the expiry to the next night
+_CONSUME_REST_DAY = [{'$set': {
+    'restDays': {'$subtract': ['$restDays', 1]},
+    'streakExpiresOn': {'$add': ['$streakExpiresOn', _ONE_DAY_MS]},
+}}]
+_RESET_STREAK = {'$set': {'streak': 0}, '$unset': {'streakExpiresOn': ''}}
+
+
+def _reset_in_batches(due, batch_size):
+    collection = User._get_collection()
+    decremented = reset = 0
+    operations = []
+
+    def flush():
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    for user in collection.find(due, {'restDays': 1, 'streak': 1}).batch_size(batch_size):
+        # Each update re-checks its condition so concurrent workouts are not overwritten
+        if user.get('restDays', 0) > 0 and user.get('streak', 0) != 0:
+            operations.append(UpdateOne({'$and': [{'_id': user['_id']}, due, {'restDays': {'$gt': 0}}]},
+                                        _CONSUME_REST_DAY))
+            decremented += 1
+        else:
+            operations.append(UpdateOne({'$and': [{'_id': user['_id']}, due]}, _RESET_STREAK))
+            reset += 1
+        if len(operations) == batch_size:
+            flush()
+    flush()
+    return decremented, reset
+
+
+def reset_user_streaks(today=None, batch_size=None):
+    """
+    Consumes a rest day of every user whose streak expired, and resets the streak
+    of those who have no rest days left.
+
+    Only users whose indexed streakExpiresOn date has passed are touched.
+
+    Args:
+        today: The date the job runs for. Defaults to the current local date.
+        batch_size: When given, users are updated with batched bulk writes of this size
+            instead of two update_many statements.
+
+    Returns:
+        A dict with the number of users who used a rest day, whose streak was reset,
+        the total modified count and the duration in milliseconds.
+    """
+    started = time.monotonic()
+    today = today or datetime.now().date()
+    due = _due_filter(today)
+
+    if batch_size:
+        decremented, reset = _reset_in_batches(due, batch_size)
+    else:
+        collection = User._get_collection()
+        # Reset first, otherwise users whose last rest day is consumed below would be reset the same night
+        reset = collection.update_many(
+            {'$and': [due, {'$or': [{'restDays': {'$not': {'$gt': 0}}}, {'streak': 0}]}]},
+            _RESET_STREAK
+        ).modified_count
+        decremented = collection.update_many(
+            {'$and': [due, {'restDays': {'$gt': 0}}, {'streak': {'$ne': 0}}]},
+            _CONSUME_REST_DAY
+        ).modified_count
+
+    return {
+        'decremented': decremented,
+        'reset': reset,
+        'modified': decremented + reset,
+        'durationMs': int((time.monotonic() - started) * 1000),
+    }
+
+
+def backfill_streak_expiry(today=None):
+    """
+    Sets streakExpiresOn for users with a streak saved before the field existed.
 
-def reset_user_streaks():
-    today = datetime.now().date()
-    users = User.objects.all()
-    count_reset = 0
+    Assumes the nightly job already ran today, so no reset is pending before tomorrow.
 
-    for user in users:
-        if not user.lastStreakEvidence or (today - user.lastStreakEvidence).days > 1:
-            if user.restDays > 0 and user.streak != 0:
-                user.restDays -= 1
-            else:
-                user.streak = 0
-                count_reset += 1
-            user.save()
+    Returns:
+        The number of updated users.
+    """
+    today = datetime.combine(today or datetime.now().date(), datetime.min.time())
+    return User._get_collection().update_many(
+        {'streak': {'$nin': [0, None]}, 'streakExpiresOn': None},
+        [{'$set': {'streakExpiresOn': {'$max': [
+            {'$add': [{'$ifNull': ['$lastStreakEvidence', today]}, _ONE_DAY_MS]},
+            today,
+        ]}}}]
+    ).modified_count
@@ -0,0 +1,12 @@
+import unicodedata
+
+
+def normalize(text):
+    """Lowercases text and folds accents, e.g. 'Jiří' -> 'jiri'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+def trigrams(text):
+    """Returns the distinct three-character substrings of text."""
+    return sorted({text[i:i + 3] for i in range(len(text) - 2)})
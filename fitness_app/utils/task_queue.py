@@ -0,0 +1,49 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadPoolBackend:
+    """Runs tasks on an in-process thread pool. Tasks still queued when the process exits are lost."""
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task-queue')
+
+    def submit(self, func, *args, **kwargs):
+        self._executor.submit(func, *args, **kwargs)
+
+
+class InlineBackend:
+    """Runs tasks synchronously in the calling thread, e.g. for scripts and debugging."""
+
+    def submit(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+
+def _default_backend():
+    if os.getenv('TASK_QUEUE_BACKEND', 'thread') == 'inline':
+        return InlineBackend()
+    return ThreadPoolBackend(max_workers=int(os.getenv('TASK_QUEUE_WORKERS', 4)))
+
+
+_backend = _default_backend()
+
+
+def set_task_backend(backend):
+    """Replaces the task backend with any object providing submit(func, *args, **kwargs)."""
+    global _backend
+    _backend = backend
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+
+
+def enqueue(func, *args, **kwargs):
+    """Schedules func(*args, **kwargs) to run in the background. Failures are logged, not raised."""
+    _backend.submit(_run, func, args, kwargs)
@@ -0,0 +1,100 @@
+import os
+
+from pymongo import UpdateOne
+
+from fitness_app.models import Timeline, Follow, Workout, User
+from fitness_app.utils.ttl_cache import TTLCache
+
+# Number of most recent entries kept in each user's materialized timeline
+TIMELINE_MAX_LENGTH = int(os.getenv('TIMELINE_MAX_LENGTH', 500))
+# Accounts with more followers are not fanned out on write; their workouts are merged in on read
+FANOUT_MAX_FOLLOWERS = int(os.getenv('FANOUT_MAX_FOLLOWERS', 5000))
+
+_fanout_on_read_users = TTLCache(maxsize=1, ttl=300)
+
+
+def _entry(workout):
+    return {'workout': workout['_id'], 'author': workout['user'], 'timestamp': workout['timestamp']}
+
+
+def _push_entries(owner_ids, entries):
+    # Timelines are not upserted: a missing one is rebuilt from all follows on the first feed read,
+    # which a partial timeline holding only the pushed entries would prevent
+    update = {'$push': {'entries': {
+        '$each': entries,
+        '$sort': {'timestamp': -1, 'workout': -1},
+        '$slice': TIMELINE_MAX_LENGTH,
+    }}}
+    operations = [UpdateOne({'user': owner_id}, update) for owner_id in owner_ids]
+    if operations:
+        Timeline._get_collection().bulk_write(operations, ordered=False)
+
+
+def _recent_workouts(author_ids):
+    return Workout.objects(user__in=author_ids).only('id', 'user', 'timestamp') \
+        .order_by('-timestamp', '-id').limit(TIMELINE_MAX_LENGTH).as_pymongo()
+
+
+def fan_out_workout(workout):
+    """Pushes a newly saved workout into the timelines of its author's followers and returns their number."""
+    author_id = workout.user.id
+    followers = Follow.objects(followed=author_id).only('follower').limit(FANOUT_MAX_FOLLOWERS + 1).as_pymongo()
+    follower_ids = [follow['follower'] for follow in followers]
+
+    if len(follower_ids) > FANOUT_MAX_FOLLOWERS:
+        if User.objects(id=author_id, fanoutOnRead__ne=True).update_one(set__fanoutOnRead=True):
+            _fanout_on_read_users.clear()
+        return 0
+
+    _push_entries(follower_ids, [{'workout': workout.id, 'author': author_id, 'timestamp': workout.timestamp}])
+    return len(follower_ids)
+
+
+def followed_fanout_on_read_ids(user_id):
+    """Returns IDs of fan-out-on-read accounts followed by the user, whose workouts are merged in on read."""
+    candidates = _fanout_on_read_users.get_or_load(
+        'ids', lambda: list(User.objects(fanoutOnRead=True).scalar('id')))
+    if not candidates:
+        return []
+    follows = Follow.objects(follower=user_id, followed__in=candidates).only('followed').as_pymongo()
+    return [follow['followed'] for follow in follows]
+
+
+def rebuild_timeline(user_id):
+    """Rebuilds a user's timeline from scratch by reading the recent workouts of everyone they follow."""
+    followed_ids = [follow['followed'] for follow in Follow.objects(follower=user_id).only('followed').as_pymongo()]
+    entries = [_entry(workout) for workout in _recent_workouts(followed_ids)] if followed_ids else []
+    Timeline.objects(user=user_id).update_one(__raw__={'$set': {'entries': entries}}, upsert=True)
+
+
+def rebuild_timelines():
+    """Rebuilds the timeline of every user who follows someone and returns their number."""
+    rebuilt = 0
+    for row in Follow._get_collection().aggregate([{'$group': {'_id': '$follower'}}], allowDiskUse=True):
+        rebuild_timeline(row['_id'])
+        rebuilt += 1
+    return rebuilt
+
+
+def backfill_timeline(follower_id, followed_id):
+    """Merges the recent workouts of a newly followed user into the follower's timeline."""
+    if User.objects(id=followed_id, fanoutOnRead=True).count():
+        return
+    entries = [_entry(workout) for workout in _recent_workouts([followed_id])]
+    if entries:
+        _push_entries([follower_id], entries)
+
+
+def remove_author_from_timeline(owner_id, author_id):
+    """Removes all workouts of author_id from owner_id's timeline, e.g. after an unfollow or block."""
+    Timeline.objects(user=owner_id).update_one(__raw__={'$pull': {'entries': {'author': author_id}}})
+
+
+def remove_workout_from_timelines(workout_id):
+    Timeline.objects(entries__workout=workout_id).update(__raw__={'$pull': {'entries': {'workout': workout_id}}})
+
+
+def delete_user_timelines(user_id):
+    """Deletes the user's own timeline and pulls their workouts from everybody else's."""
+    Timeline.objects(user=user_id).delete()
+    Timeline.objects(entries__author=user_id).update(__raw__={'$pull': {'entries': {'author': user_id}}})
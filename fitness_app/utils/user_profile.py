@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fitness_app.models import Workout, Routine, Follow
+from fitness_app.utils.feed_query import fetch_feed_page
+from fitness_app.utils.reset_user_streaks import live_streak
+from fitness_app.utils.serializer import serialize_documents
+from fitness_app.utils.user_stats import get_user_stats
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='user-profile')
+
+
+def _user_fields(user):
+    # Reflect resets that are due even if the nightly job has not applied them yet
+    streak, rest_days = live_streak(user)
+    return {
+        "_id": str(user.id),
+        "username": user.username,
+        "birthDate": user.birthDate,
+        "registrationDate": user.registrationDate,
+        "profilePhotoUrl": user.profilePhotoUrl,
+        "lastStreakEvidence": user.lastStreakEvidence,
+        "streakExpiresOn": user.streakExpiresOn,
+        "streak": streak,
+        "restDays": rest_days,
+    }
+
+
+def build_full_profile(user):
+    """Builds the legacy profile embedding every workout, routine and follow of the user."""
+    user_data = _user_fields(user)
+    user_data.update({
+        "workouts": serialize_documents(Workout.objects(user=user.id)),
+        "routines": serialize_documents(Routine.objects(user=user.id)),
+        "followers": serialize_documents(Follow.objects(followed=user.id)),
+        "following": serialize_documents(Follow.objects(follower=user.id)),
+    })
+    return user_data
+
+
+def build_profile_summary(user, limit=10):
+    """
+    Builds a bounded profile with summary counts and the first page of the user's workouts.
+
+    The independent sub-queries run concurrently, so the response costs about one round trip.
+
+    Args:
+        user: The User document.
+        limit: Number of most recent workouts to include.
+
+    Returns:
+        A dict of profile fields, counts and the first workout page with its cursor.
+    """
+    stats = _executor.submit(get_user_stats, user.id)
+    followers_count = _executor.submit(Follow.objects(followed=user.id).count)
+    following_count = _executor.submit(Follow.objects(follower=user.id).count)
+    workouts_page = _executor.submit(fetch_feed_page, {'user': user.id}, limit=limit)
+
+    workouts, has_more, next_cursor = workouts_page.result()
+
+    user_data = _user_fields(user)
+    user_data.update(stats.result())
+    user_data.update({
+        "followersCount": followers_count.result(),
+        "followingCount": following_count.result(),
+        "workouts": workouts,
+        "workoutsHasMore": has_more,
+        "workoutsNextCursor": next_cursor,
+    })
+    return user_data
@@ -0,0 +1,93 @@
+import re
+
+from pymongo import UpdateOne
+
+from fitness_app.models import User
+from fitness_app.utils.cursor import encode_cursor, keyset_filter
+from fitness_app.utils.search_text import normalize, trigrams
+
+# Ranking tiers; exact matches sort first within the prefix tier because they are the shortest keys
+PREFIX_TIER = 0
+INFIX_TIER = 1
+
+
+def _tier_queries(key):
+    prefix = {'searchKey': {'$regex': f'^{re.escape(key)}'}}
+    tiers = [(PREFIX_TIER, prefix)]
+    # Infix matches need at least one trigram to be served from the searchGrams index
+    if len(key) >= 3:
+        tiers.append((INFIX_TIER, {'$and': [
+            {'searchGrams': {'$all': trigrams(key)}},
+            {'searchKey': {'$regex': re.escape(key)}},
+            {'searchKey': {'$not': re.compile(f'^{re.escape(key)}')}},
+        ]}))
+    return tiers
+
+
+def search_users(query, exclude_ids, limit=10, skip=0, after=None):
+    """
+    Searches users by normalized username, ranking exact > prefix > infix matches.
+
+    Args:
+        query: The raw search string typed by the user.
+        exclude_ids: ObjectIds of users that must not appear in the results.
+        limit: Maximum number of users to return.
+        skip: Number of ranked results to skip. Ignored when `after` is given.
+        after: Decoded (tier, searchKey, _id) cursor of the last user already seen.
+
+    Returns:
+        A tuple of (users, has_more, next_cursor) where users are dicts with _id, username and profilePhotoUrl.
+    """
+    if after:
+        skip = 0
+    wanted = skip + limit + 1
+
+    results = []
+    for tier, tier_query in _tier_queries(normalize(query)):
+        if after and tier < after[0]:
+            continue
+        if after and tier == after[0]:
+            tier_query = {'$and': [tier_query, keyset_filter('searchKey', after[1], after[2], descending=False)]}
+
+        users = User.objects(__raw__=tier_query, id__nin=list(exclude_ids)) \
+            .only('id', 'username', 'profilePhotoUrl', 'searchKey').order_by('searchKey', 'id') \
+            .limit(wanted - len(results)).as_pymongo()
+        results += [(tier, user) for user in users]
+        if len(results) >= wanted:
+            break
+
+    results = results[skip:]
+    has_more = len(results) > limit
+    results = results[:limit]
+    next_cursor = None
+    if results:
+        last_tier, last_user = results[-1]
+        next_cursor = encode_cursor(last_tier, last_user.get('searchKey'), last_user['_id'])
+
+    users = [{
+        "_id": str(user['_id']),
+        "username": user['username'],
+        "profilePhotoUrl": user.get('profilePhotoUrl')
+    } for _, user in results]
+    return users, has_more, next_cursor
+
+
+def backfill_user_search_keys(batch_size=1000):
+    """
+    Computes searchKey and searchGrams for users saved before they existed.
+
+    Returns:
+        The number of updated users.
+    """
+    updated = 0
+    operations = []
+    for user in User.objects(searchKey=None).only('id', 'username').as_pymongo().batch_size(batch_size):
+        search_key = normalize(user['username'])
+        operations.append(UpdateOne({'_id': user['_id']},
+                                    {'$set': {'searchKey': search_key, 'searchGrams': trigrams(search_key)}}))
+        if len(operations) == batch_size:
+            updated += User._get_collection().bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += User._get_collection().bulk_write(operations, ordered=False).modified_count
+    return updated
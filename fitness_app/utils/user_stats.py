@@ -0,0 +1,78 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from fitness_app.models import UserStats, Workout, User
+
+
+def record_workout(workout, streak):
+    """Adds a newly saved workout to its author's stats."""
+    collection = UserStats._get_collection()
+    result = collection.update_one(
+        {'user': workout.user.id},
+        {
+            '$inc': {'workoutsCount': 1, 'totalDuration': workout.duration},
+            '$max': {'longestStreak': streak, 'lastWorkoutAt': workout.timestamp},
+        }
+    )
+    # A document counting only this workout would never be rebuilt, so count all of them
+    if not result.matched_count:
+        rebuild_user_stats([workout.user.id])
+        collection.update_one({'user': workout.user.id}, {'$max': {'longestStreak': streak}})
+
+
+def remove_workout(workout):
+    """Atomically subtracts a deleted workout from its author's stats. lastWorkoutAt is kept."""
+    UserStats._get_collection().update_one(
+        {'user': workout.user.id},
+        {'$inc': {'workoutsCount': -1, 'totalDuration': -workout.duration}}
+    )
+
+
+def rebuild_user_stats(user_ids=None, batch_size=500):
+    """Recomputes the stats of the given users (or of every user with a workout) and returns the number written."""
+    match = {'user': {'$in': list(user_ids)}} if user_ids is not None else {}
+    totals = {row['_id']: row for row in Workout.objects.aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$user', 'count': {'$sum': 1}, 'duration': {'$sum': '$duration'},
+                    'last': {'$max': '$timestamp'}}},
+    ], allowDiskUse=True)}
+    if user_ids is not None:
+        for user_id in user_ids:
+            totals.setdefault(user_id, {'_id': user_id, 'count': 0, 'duration': 0, 'last': None})
+
+    streaks = {}
+    user_list = list(totals)
+    for start in range(0, len(user_list), batch_size):
+        chunk = user_list[start:start + batch_size]
+        streaks.update((user['_id'], user.get('streak', 0))
+                       for user in User.objects(id__in=chunk).only('streak').as_pymongo())
+
+    operations = [UpdateOne(
+        {'user': user_id},
+        {
+            '$set': {'workoutsCount': row['count'], 'totalDuration': row['duration'], 'lastWorkoutAt': row['last']},
+            '$max': {'longestStreak': streaks.get(user_id, 0)},
+        },
+        upsert=True
+    ) for user_id, row in totals.items()]
+
+    written = 0
+    for start in range(0, len(operations), batch_size):
+        result = UserStats._get_collection().bulk_write(operations[start:start + batch_size], ordered=False)
+        written += result.modified_count + result.upserted_count
+    return written
+
+
+def get_user_stats(user_id):
+    """Returns the user's workout stats, building them on first access."""
+    user_id = ObjectId(user_id)
+    stats = UserStats.objects(user=user_id).as_pymongo().first()
+    if stats is None:
+        rebuild_user_stats([user_id])
+        stats = UserStats.objects(user=user_id).as_pymongo().first() or {}
+    return {
+        'workoutsCount': stats.get('workoutsCount', 0),
+        'totalMinutes': stats.get('totalDuration', 0) / 60,
+        'longestStreak': stats.get('longestStreak', 0),
+        'lastWorkoutAt': stats.get('lastWorkoutAt'),
+    }
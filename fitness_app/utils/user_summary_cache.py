@@ -0,0 +1,86 @@
+import os
+
+from bson import ObjectId
+
+from fitness_app.models import User
+from fitness_app.utils.batch_loader import user_summary, USER_SUMMARY_FIELDS
+from fitness_app.utils.ttl_cache import TTLCache
+
+# Number of user summaries cached per process and seconds each is kept
+USER_SUMMARY_CACHE_SIZE = int(os.getenv('USER_SUMMARY_CACHE_SIZE', 10000))
+USER_SUMMARY_CACHE_TTL = int(os.getenv('USER_SUMMARY_CACHE_TTL', 300))
+
+_MISSING = object()
+
+
+class LocalSummaryBackend:
+    """Keeps user summaries in an in-process TTLCache. Other backends provide the same three methods."""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self._cache.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        for key, value in mapping.items():
+            self._cache.set(key, value)
+
+    def delete_many(self, keys):
+        self._cache.invalidate(*keys)
+
+
+class BroadcastSummaryBackend(LocalSummaryBackend):
+    """Keeps user summaries in an in-process TTLCache and broadcasts invalidations to every process."""
+
+    def __init__(self, maxsize, ttl, pubsub):
+        super().__init__(maxsize, ttl)
+        self._pubsub = pubsub
+        pubsub.start(self._invalidate)
+
+    def delete_many(self, keys):
+        super().delete_many(keys)
+        self._pubsub.publish(None, {'invalidate': [str(key) for key in keys]})
+
+    def _invalidate(self, _, message):
+        super().delete_many([ObjectId(key) for key in message['invalidate']])
+
+
+_backend = LocalSummaryBackend(maxsize=USER_SUMMARY_CACHE_SIZE, ttl=USER_SUMMARY_CACHE_TTL)
+
+
+def set_user_summary_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_user_summaries(user_ids):
+    """
+    Returns the public summaries of the given users, loading all cache misses with one `$in` query.
+
+    Args:
+        user_ids: User IDs as strings or ObjectIds.
+
+    Returns:
+        A dict mapping each ObjectId to a {_id, username, profilePhotoUrl} dict. Users that do not
+        exist are left out. The dicts are shared with the cache and must not be modified.
+    """
+    ids = list({ObjectId(user_id) for user_id in user_ids})
+    summaries = _backend.get_many(ids)
+    missing = [user_id for user_id in ids if user_id not in summaries]
+    if missing:
+        users = User._get_collection().find({'_id': {'$in': missing}}, {name: 1 for name in USER_SUMMARY_FIELDS})
+        loaded = {user['_id']: user_summary(user) for user in users}
+        _backend.set_many(loaded)
+        summaries.update(loaded)
+    return summaries
+
+
+def invalidate_user_summaries(*user_ids):
+    """Drops cached summaries after a user's username or profile photo changed or the user was deleted."""
+    _backend.delete_many([ObjectId(user_id) for user_id in user_ids])
@@ -1,6 +1,10 @@
 from fitness_app import create_app
+from fitness_app.utils.exercise_catalog import warm_exercise_catalog
+from fitness_app.utils.task_queue import enqueue
 
 app = create_app()
+# Load the exercise catalog in the background so the first requests are served from memory
+enqueue(warm_exercise_catalog)
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()
@@ -0,0 +1,131 @@
+import datetime
+
+import mongoengine
+import mongomock
+import mongomock.aggregate
+import pytest
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import JWTManager, create_access_token
+
+from fitness_app.routes.achievements_routes import achievements_bp
+from fitness_app.routes.comments_routes import comments_bp
+from fitness_app.routes.likes_routes import likes_bp
+from fitness_app.routes.notifications_routes import notifications_bp
+from fitness_app.routes.workouts_routes import workouts_bp
+from fitness_app.utils.achievement_catalog import invalidate_achievement_catalog
+from fitness_app.utils.block_cache import _blocked_users
+from fitness_app.utils.timeline import _fanout_on_read_users
+from fitness_app.utils.user_summary_cache import LocalSummaryBackend, set_user_summary_backend
+
+
+def _add_dates(original):
+    # mongomock's $add only takes numbers, MongoDB also adds milliseconds to a date
+    def handle(parser, operator, values):
+        if operator == '$add':
+            parsed = [parser.parse(value) for value in values]
+            dates = [value for value in parsed if isinstance(value, datetime.datetime)]
+            if len(dates) == 1:
+                milliseconds = sum(value for value in parsed if not isinstance(value, datetime.datetime))
+                return dates[0] + datetime.timedelta(milliseconds=milliseconds)
+        return original(parser, operator, values)
+    return handle
+
+
+mongomock.aggregate._Parser._handle_arithmetic_operator = _add_dates(
+    mongomock.aggregate._Parser._handle_arithmetic_operator)
+
+
+def _union_with(in_collection, database, options):
+    # mongomock has no $unionWith
+    return list(in_collection) + list(database.get_collection(options['coll']).aggregate(options['pipeline']))
+
+
+mongomock.aggregate._PIPELINE_HANDLERS['$unionWith'] = _union_with
+
+
+@pytest.fixture(autouse=True)
+def db():
+    """Connects the models to a fresh in-memory database for every test."""
+    mongoengine.connect('trekly_test', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    yield
+    mongoengine.disconnect()
+
+
+
+_READ_METHODS = ('find', 'find_one', 'aggregate', 'count_documents', 'estimated_document_count', 'distinct')
+
+
+@pytest.fixture
+def count_queries(monkeypatch):
+    """
+    Counts the read commands sent to the database. Calls the fake collection makes
+    to itself while serving one command are not counted again.
+
+    Returns:
+        A list that receives the (collection name, method) of every command.
+    """
+    queries = []
+    depth = [0]
+
+    def counted(name, original):
+        def method(collection, *args, **kwargs):
+            if not depth[0]:
+                queries.append((collection.name, name))
+            depth[0] += 1
+            try:
+                return original(collection, *args, **kwargs)
+            finally:
+                depth[0] -= 1
+        return method
+
+    for name in _READ_METHODS:
+        monkeypatch.setattr(mongomock.collection.Collection, name,
+                            counted(name, getattr(mongomock.collection.Collection, name)))
+    return queries
+
+
+class _JSONProvider(DefaultJSONProvider):
+    """Serializes ObjectIds like the provider flask_mongoengine installs in the real app."""
+
+    @staticmethod
+    def default(o):
+        return str(o) if isinstance(o, ObjectId) else DefaultJSONProvider.default(o)
+
+
+@pytest.fixture
+def app():
+    app = Flask('trekly_test')
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-that-is-long-enough'
+    JWTManager(app)
+    app.json = _JSONProvider(app)
+    for blueprint, prefix in ((workouts_bp, '/workouts'), (likes_bp, '/likes'), (comments_bp, '/comments'),
+                              (achievements_bp, '/achievements'), (notifications_bp, '/notifications')):
+        app.register_blueprint(blueprint, url_prefix=prefix)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    def headers(user_id):
+        with app.app_context():
+            return {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+    return headers
+
+
+@pytest.fixture
+def clear_caches():
+    """Returns a function emptying the in-process caches, so every request starts cold."""
+    def clear():
+        set_user_summary_backend(LocalSummaryBackend(maxsize=1000, ttl=60))
+        invalidate_achievement_catalog()
+        _blocked_users.clear()
+        _fanout_on_read_users.clear()
+    clear()
+    return clear
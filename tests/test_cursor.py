@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from fitness_app.utils.cursor import encode_cursor, decode_cursor
+
+
+def test_round_trip():
+    values = [datetime(2024, 3, 1, 12), ObjectId()]
+    assert decode_cursor(encode_cursor(*values), datetime, ObjectId) == values
+
+
+@pytest.mark.parametrize('values, types', [
+    (['x', 'y', ObjectId()], (int, (str, type(None)), ObjectId)),
+    ([1], (ObjectId,)),
+    (['2024-03-01', ObjectId()], (datetime, ObjectId)),
+    ([datetime(2024, 3, 1)], (datetime, ObjectId)),
+])
+def test_rejects_unexpected_values(values, types):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(*values), *types)
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24=', encode_cursor()[:-1] + '{'])
+def test_rejects_malformed_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, ObjectId)
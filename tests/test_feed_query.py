@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from fitness_app.models import Workout, Timeline, WorkoutLike, WorkoutComment, Block, Follow, User
+from fitness_app.utils import feed_query
+from fitness_app.utils.cursor import decode_cursor
+from fitness_app.utils.feed_query import fetch_feed_page, fetch_timeline_page
+
+NOW = datetime(2024, 3, 1, 12)
+
+
+def _workouts(count, author_id):
+    workouts = [{'_id': ObjectId(), 'user': author_id, 'name': f'w{index}', 'duration': 600, 'difficulty': 2,
+                 'exercises': [], 'timestamp': NOW - timedelta(minutes=index)} for index in range(count)]
+    Workout._get_collection().insert_many(workouts)
+    return workouts
+
+
+def _global_page(owner_id, author_id, limit, after=None):
+    return fetch_feed_page({'user': author_id}, limit=limit, after=after)
+
+
+def _followed_page(owner_id, author_id, limit, after=None):
+    return fetch_timeline_page(owner_id, limit=limit, after=after)
+
+
+@pytest.mark.parametrize('fetch_page', [_global_page, _followed_page])
+@pytest.mark.parametrize('limit', [1, 5, 25])
+def test_feed_page_is_one_round_trip(count_queries, fetch_page, limit):
+    owner_id, author_id = ObjectId(), ObjectId()
+    workouts = _workouts(30, author_id)
+    Timeline._get_collection().insert_one({'user': owner_id, 'entries': [
+        {'workout': workout['_id'], 'author': author_id, 'timestamp': workout['timestamp']} for workout in workouts
+    ]})
+
+    seen = []
+    after = None
+    while True:
+        count_queries.clear()
+        page, has_more, next_cursor = fetch_page(owner_id, author_id, limit, after)
+        assert len(count_queries) == 1, count_queries
+        assert len(page) <= limit
+        seen += [workout['_id'] for workout in page]
+        if not has_more:
+            break
+        after = decode_cursor(next_cursor, datetime, ObjectId)
+
+    assert seen == [str(workout['_id']) for workout in workouts]
+
+
+def _lookup_engagement_stages(viewer_id):
+    # mongomock cannot run $lookup with let/pipeline, these stages compute the same flags
+    stages = []
+    for field, model in (('likedByMe', WorkoutLike), ('commentedByMe', WorkoutComment)):
+        stages += [
+            {'$lookup': {'from': model._get_collection_name(), 'localField': '_id', 'foreignField': 'workout',
+                         'as': field}},
+            {'$set': {field: {'$gt': [{'$size': {'$filter': {
+                'input': f'${field}', 'cond': {'$eq': ['$$this.user', viewer_id]}}}}, 0]}}},
+        ]
+    return stages
+
+
+def _read_feed(client, headers, feed_type, limit, count_queries):
+    pages = []
+    seen = []
+    after = None
+    while True:
+        count_queries.clear()
+        url = f'/workouts/all?feedType={feed_type}&limit={limit}' + (f'&after={after}' if after else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        pages.append(list(count_queries))
+        seen += [workout['_id'] for workout in body['workouts']]
+        if not body['hasMore']:
+            return pages, seen
+        after = body['nextCursor']
+
+
+@pytest.mark.parametrize('limit', [1, 5, 25])
+def test_global_feed_endpoint_queries_per_page(client, auth_headers, count_queries, clear_caches, monkeypatch,
+                                               limit):
+    monkeypatch.setattr(feed_query, '_engagement_stages', _lookup_engagement_stages)
+    viewer_id, author_id, blocked_id = ObjectId(), ObjectId(), ObjectId()
+    workouts = _workouts(30, author_id)
+    _workouts(3, blocked_id)
+    Block._get_collection().insert_one({'blocking': viewer_id, 'blocked': blocked_id})
+
+    pages, seen = _read_feed(client, auth_headers(viewer_id), 'global', limit, count_queries)
+
+    # The block list is loaded once and cached for the following pages
+    assert pages[0] == [('userBlocks', 'find'), ('workouts', 'aggregate')]
+    assert all(page == [('workouts', 'aggregate')] for page in pages[1:]), pages
+    assert seen == [str(workout['_id']) for workout in workouts]
+
+
+@pytest.mark.parametrize('limit', [1, 5, 25])
+def test_followed_feed_endpoint_queries_per_page(client, auth_headers, count_queries, clear_caches, monkeypatch,
+                                                 limit):
+    monkeypatch.setattr(feed_query, '_engagement_stages', _lookup_engagement_stages)
+    viewer_id, author_id, popular_id = ObjectId(), ObjectId(), ObjectId()
+    User._get_collection().insert_one({'_id': popular_id, 'username': 'popular', 'email': 'popular@example.com',
+                                       'password': 'x', 'fanoutOnRead': True})
+    Follow._get_collection().insert_many([{'follower': viewer_id, 'followed': author_id},
+                                          {'follower': viewer_id, 'followed': popular_id}])
+    workouts = sorted(_workouts(20, author_id) + _workouts(20, popular_id),
+                      key=lambda workout: (workout['timestamp'], workout['_id']), reverse=True)
+
+    pages, seen = _read_feed(client, auth_headers(viewer_id), 'followed', limit, count_queries)
+
+    # The first read finds no timeline and builds it from the viewer's follows
+    assert pages[0] == [('users', 'find'), ('follows', 'find'), ('timelines', 'aggregate'),
+                        ('timelines', 'count_documents'), ('follows', 'find'), ('workouts', 'find'),
+                        ('timelines', 'aggregate')]
+    # Later pages merge the fan-out-on-read account into the timeline within the same aggregation
+    assert all(page == [('follows', 'find'), ('timelines', 'aggregate')] for page in pages[1:]), pages
+    assert seen == [str(workout['_id']) for workout in workouts]
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from fitness_app.models import User, Workout, WorkoutLike, WorkoutComment, Notification, Achievement, \
+    AchievementGained
+
+NOW = datetime(2024, 3, 1, 12)
+
+
+def _users(count):
+    users = [{'_id': ObjectId(), 'username': f'user{ObjectId()}', 'email': f'{ObjectId()}@example.com',
+              'password': 'x', 'profilePhotoUrl': None} for _ in range(count)]
+    User._get_collection().insert_many(users)
+    return [user['_id'] for user in users]
+
+
+def _workout(owner_id):
+    return Workout._get_collection().insert_one({
+        'user': owner_id, 'name': 'w', 'duration': 600, 'difficulty': 2, 'exercises': [], 'timestamp': NOW,
+    }).inserted_id
+
+
+def _rows():
+    """Creates one small and one large list for each endpoint and returns their (small, large) keys."""
+    small_users, large_users = _users(1), _users(12)
+    owner_id = _users(1)[0]
+    keys = {}
+    for size, user_ids in (('small', small_users), ('large', large_users)):
+        workout_id = _workout(owner_id)
+        timestamps = [NOW - timedelta(minutes=index) for index in range(len(user_ids))]
+        WorkoutLike._get_collection().insert_many(
+            [{'user': user_id, 'workout': workout_id, 'timestamp': timestamp}
+             for user_id, timestamp in zip(user_ids, timestamps)])
+        WorkoutComment._get_collection().insert_many(
+            [{'user': user_id, 'workout': workout_id, 'body': 'nice', 'timestamp': timestamp}
+             for user_id, timestamp in zip(user_ids, timestamps)])
+
+        recipient_id = _users(1)[0]
+        Notification._get_collection().insert_many(
+            [{'user': recipient_id, 'initiator': user_id, 'action': 'like', 'targetWorkout': _workout(recipient_id),
+              'read': False, 'timestamp': timestamp} for user_id, timestamp in zip(user_ids, timestamps)])
+
+        achievement_ids = Achievement._get_collection().insert_many(
+            [{'name': f'a{index}', 'description': 'd', 'conditions': []} for index in range(len(user_ids))]
+        ).inserted_ids
+        AchievementGained._get_collection().insert_many(
+            [{'user': recipient_id, 'achievement': achievement_id, 'timestamp': NOW, 'reported': True}
+             for achievement_id in achievement_ids])
+
+        keys[size] = {'workout': workout_id, 'recipient': recipient_id, 'rows': len(user_ids)}
+    return keys
+
+
+@pytest.mark.parametrize('url, viewer', [
+    ('/likes/{workout}', 'recipient'),
+    ('/comments/{workout}', 'recipient'),
+    ('/notifications/all?limit=20', 'recipient'),
+    ('/notifications/all', 'recipient'),
+    ('/achievements/{recipient}', 'recipient'),
+])
+def test_list_endpoints_issue_constant_number_of_queries(client, auth_headers, count_queries, clear_caches,
+                                                         url, viewer):
+    keys = _rows()
+
+    counts = {}
+    for size, key in keys.items():
+        clear_caches()
+        count_queries.clear()
+        response = client.get(url.format(**key), headers=auth_headers(key[viewer]))
+        assert response.status_code == 200
+        body = response.get_json()
+        rows = body['notifications'] if isinstance(body, dict) else body
+        assert len(rows) == key['rows']
+        counts[size] = len(count_queries)
+
+    assert counts['small'] == counts['large'], count_queries
@@ -0,0 +1,83 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from fitness_app.models import User
+from fitness_app.utils.reset_user_streaks import reset_user_streaks, streak_expiry
+
+START = date(2024, 3, 1)
+NIGHTS = 6
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _generate_population(size, seed=7):
+    rng = random.Random(seed)
+    users = []
+    for index in range(size):
+        evidence = START - timedelta(days=rng.randint(0, 6)) if rng.random() < 0.85 else None
+        users.append({
+            'username': f'user{index}',
+            'email': f'user{index}@example.com',
+            'password': 'x',
+            'lastStreakEvidence': evidence,
+            'streak': rng.randint(1, 5) if evidence and rng.random() < 0.8 else 0,
+            'restDays': rng.randint(0, 3),
+        })
+    return users
+
+
+def _legacy_reset(users, today):
+    """The original job: loads every user and saves the ones whose streak evidence is too old."""
+    for user in users:
+        if not user['lastStreakEvidence'] or (today - user['lastStreakEvidence']).days > 1:
+            if user['restDays'] > 0 and user['streak'] != 0:
+                user['restDays'] -= 1
+            else:
+                user['streak'] = 0
+
+
+def _insert(users):
+    documents = []
+    for user in users:
+        document = dict(user, lastStreakEvidence=_midnight(user['lastStreakEvidence'])
+                        if user['lastStreakEvidence'] else None)
+        if user['streak']:
+            # As written by a saved workout
+            document['streakExpiresOn'] = _midnight(streak_expiry(user['lastStreakEvidence']))
+        documents.append(document)
+    User._get_collection().insert_many(documents)
+
+
+@pytest.mark.parametrize('batch_size', [None, 7])
+def test_matches_legacy_per_user_loop(batch_size):
+    expected = _generate_population(300)
+    _insert(expected)
+
+    for night in range(NIGHTS):
+        today = START + timedelta(days=night)
+        _legacy_reset(expected, today)
+        reset_user_streaks(today=today, batch_size=batch_size)
+
+        actual = {user['username']: (user['streak'], user['restDays'])
+                  for user in User._get_collection().find({}, {'username': 1, 'streak': 1, 'restDays': 1})}
+        assert actual == {user['username']: (user['streak'], user['restDays']) for user in expected}, \
+            f'diverged on {today}'
+
+
+def test_reports_counts():
+    _insert([
+        {'username': 'rest', 'email': 'rest@example.com', 'password': 'x',
+         'lastStreakEvidence': START - timedelta(days=2), 'streak': 3, 'restDays': 1},
+        {'username': 'reset', 'email': 'reset@example.com', 'password': 'x',
+         'lastStreakEvidence': START - timedelta(days=2), 'streak': 3, 'restDays': 0},
+        {'username': 'alive', 'email': 'alive@example.com', 'password': 'x',
+         'lastStreakEvidence': START - timedelta(days=1), 'streak': 3, 'restDays': 0},
+    ])
+
+    result = reset_user_streaks(today=START)
+
+    assert (result['decremented'], result['reset'], result['modified']) == (1, 1, 2)
@@ -0,0 +1,40 @@
+from bson import ObjectId
+
+from fitness_app.models import User
+from fitness_app.utils import user_summary_cache
+from fitness_app.utils.user_summary_cache import BroadcastSummaryBackend, get_user_summaries, \
+    invalidate_user_summaries
+
+
+class _SharedPubSub:
+    """Delivers every message to the handlers of all instances, like processes sharing one collection."""
+
+    handlers = []
+
+    def start(self, handler):
+        self.handlers.append(handler)
+
+    def publish(self, user_id, message):
+        for handler in self.handlers:
+            handler(user_id, message)
+
+
+def test_invalidation_reaches_other_processes(monkeypatch):
+    monkeypatch.setattr(_SharedPubSub, 'handlers', [])
+    this_process = BroadcastSummaryBackend(100, 60, _SharedPubSub())
+    other_process = BroadcastSummaryBackend(100, 60, _SharedPubSub())
+    user_id = ObjectId()
+    User._get_collection().insert_one({'_id': user_id, 'username': 'before', 'email': 'a@example.com',
+                                       'password': 'x'})
+
+    for backend in (this_process, other_process):
+        monkeypatch.setattr(user_summary_cache, '_backend', backend)
+        assert get_user_summaries([user_id])[user_id]['username'] == 'before'
+
+    User._get_collection().update_one({'_id': user_id}, {'$set': {'username': 'after'}})
+    monkeypatch.setattr(user_summary_cache, '_backend', this_process)
+    invalidate_user_summaries(user_id)
+
+    monkeypatch.setattr(user_summary_cache, '_backend', other_process)
+    assert get_user_summaries([user_id])[user_id]['username'] == 'after'
+
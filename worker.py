@@ -0,0 +1,7 @@
+from fitness_app import create_app, start_scheduler
+
+app = create_app()
+
+if __name__ == "__main__":
+    # Dedicated job runner process, the web workers do not run the scheduled jobs
+    start_scheduler(app, blocking=True)